@@ -1,40 +1,94 @@
 # -*- coding:utf-8 -*-
 
-import json
+import time
 import asyncio
+import logging
 import websockets
+from .metrics import Registry
+from .serializer import Serializer
 from bitsharesbase import operations
 from bitsharesbase.chains import known_chains
 
 class RPCError(Exception):
     pass
 
+class RPCTimeoutError(RPCError):
+    pass
+
+# 各方法请求延迟和错误(所有连接共享)
+_latency = Registry().histogram('btsmonitor_rpc_request_duration_seconds',
+    'Node request duration by method', ['method'])
+_errors = Registry().counter('btsmonitor_rpc_request_errors_total',
+    'Node request errors by method and kind', ['method', 'kind'])
+
+def latency_statistics():
+    ''' 各方法请求延迟统计
+    '''
+    return dict([(values[0], h.statistics()) for values, h in _latency.samples()])
+
+def _observe_latency(name, value):
+    ''' 记录请求延迟
+    '''
+    _latency.labels(name).observe(value)
+
 class AsyncRPC(object):
     ''' 异步RPC客户端
         :param url 节点地址
+        :param timeout 默认请求超时(秒)
+        :param max_inflight 最大并发请求数量
     '''
-    api_id = {}
     chain_params = None
 
-    def __init__(self, access, loop=None):
-        self.url = 'wss://' + access
+    def __init__(self, access, loop=None, timeout=30, max_inflight=256):
+        self.url = access if '://' in access else 'wss://' + access
+        self.access = access
+        self.api_id = {}
         self._loop = loop
+        self._timeout = timeout
+        self._inflight = asyncio.Semaphore(max_inflight)
         self._result = {}
         self._request_id = 0
         self._websocket = None
+        self._subscribers = {}
         if self._loop is None:
             self._loop = asyncio.get_event_loop()
         self._almost_ready = asyncio.Future(loop=self._loop)
+        self._closed = asyncio.Future(loop=self._loop)
         asyncio.ensure_future(self._open_connection(), loop=self._loop)
 
+    @property
+    def is_ready(self):
+        ''' 是否可用
+        '''
+        return (self._almost_ready.done() and self._almost_ready.result()
+            and not self._closed.done())
+
     async def close(self):
-        await self._websocket.close()
+        if self._websocket is not None:
+            await self._websocket.close()
 
     async def wait_for_ready(self):
         ''' 等待就绪
         '''
         return await asyncio.wait_for(self._almost_ready, None)
 
+    async def wait_for_closed(self):
+        ''' 等待断开
+        '''
+        return await asyncio.shield(self._closed)
+
+    def subscribe(self, callback_id, handler):
+        ''' 注册通知回调
+            :param callback_id 回调id, 与set_subscribe_callback等接口参数一致
+            :param handler 回调函数, 参数为通知内容
+        '''
+        self._subscribers[callback_id] = handler
+
+    def unsubscribe(self, callback_id):
+        ''' 注销通知回调
+        '''
+        self._subscribers.pop(callback_id, None)
+
     async def _on_open(self):
         ''' 连接成功
         '''
@@ -51,16 +105,26 @@ class AsyncRPC(object):
                 operations.default_prefix = self.chain_params['prefix']
                 break
         if self.chain_params == None:
-            raise('Connecting to unknown network!')
+            raise RPCError('Connecting to unknown network!')
 
         self._almost_ready.set_result(True)
 
     def _on_messsage(self, payload):
         ''' 收到消息
         '''
-        res = json.loads(payload)
+        res = Serializer().loads(payload)
+        if res.get('method') == 'notice':
+            callback_id, notices = res['params'][0], res['params'][1]
+            if callback_id in self._subscribers:
+                try:
+                    self._subscribers[callback_id](notices)
+                except Exception as e:
+                    logging.warn('Failed to handle notice#%s, %s', callback_id, str(e))
+            return
         if 'id' in res  and res['id'] in self._result:
-            self._result[res['id']].set_result(res)
+            future = self._result[res['id']]
+            if not future.done():
+                future.set_result(res)
 
     async def _recv_message(self):
         ''' 接收消息
@@ -78,31 +142,83 @@ class AsyncRPC(object):
         try:
             async with websockets.connect(self.url, max_size=2**20*8, max_queue=2**5*2) as websocket:
                 self._websocket = websocket
-                task1 = asyncio.ensure_future(self._on_open(), loop=self._loop)
-                task2 = asyncio.ensure_future(self._recv_message(), loop=self._loop)
-                await asyncio.wait([task1, task2])
+                task = asyncio.ensure_future(self._on_open(), loop=self._loop)
+                task.add_done_callback(self._on_open_done)
+                await self._recv_message()
+                if not task.done():
+                    task.cancel()
         except Exception:
-            self._almost_ready.set_result(False)
+            pass
+        finally:
+            if not self._almost_ready.done():
+                self._almost_ready.set_result(False)
+            self._closed.set_result(True)
+            self._fail_pending(RPCError('Connection closed'))
+
+    def _on_open_done(self, task):
+        ''' 初始化完成
+        '''
+        if task.cancelled() or task.exception() is not None:
+            if not self._almost_ready.done():
+                self._almost_ready.set_result(False)
+            asyncio.ensure_future(self.close(), loop=self._loop)
 
-    async def _rpc(self, params):
+    def _fail_pending(self, error):
+        ''' 终止未完成请求
+        '''
+        for future in self._result.values():
+            if not future.done():
+                future.set_exception(error)
+        self._result.clear()
+
+    async def gather(self, calls, return_exceptions=False):
+        ''' 并发执行多个请求
+            :param calls 请求列表, 每项为(方法名, 参数列表)或(方法名, 参数列表, 关键字参数)
+        '''
+        futures = []
+        for call in calls:
+            kwargs = call[2] if len(call) > 2 else {}
+            futures.append(getattr(self, call[0])(*call[1], **kwargs))
+        return await asyncio.gather(*futures, return_exceptions=return_exceptions)
+
+    async def _rpc(self, params, timeout=None):
         ''' 远程过程调用
         '''
-        # 生成请求id
-        self._request_id += 1
-        request_id = self._request_id
+        if timeout is None:
+            timeout = self._timeout
+
+        async with self._inflight:
+            # 生成请求id
+            self._request_id += 1
+            request_id = self._request_id
 
-        # 生成请求内容
-        request = {'id': request_id, 'method': 'call', 'params': params}
-        future = self._result[request_id] = asyncio.Future(loop=self._loop)
+            # 生成请求内容
+            request = {'id': request_id, 'method': 'call', 'params': params}
+            future = self._result[request_id] = asyncio.Future(loop=self._loop)
 
-        # 异步执行请求
-        await self._websocket.send(json.dumps(request).encode('utf8'))
-        await asyncio.wait_for(future, None)
-        self._result.pop(request_id)
+            # 异步执行请求
+            start = time.monotonic()
+            try:
+                if self._closed.done():
+                    raise RPCError('Connection closed')
+                await self._websocket.send(Serializer().dumps(request))
+                ret = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                _errors.labels(params[1], 'timeout').inc()
+                raise RPCTimeoutError('Request {0} timed out after {1}s'.format(params[1], timeout))
+            except RPCError:
+                _errors.labels(params[1], 'connection').inc()
+                raise
+            except websockets.ConnectionClosed:
+                _errors.labels(params[1], 'connection').inc()
+                raise RPCError('Connection closed')
+            finally:
+                self._result.pop(request_id, None)
+                _observe_latency(params[1], time.monotonic() - start)
 
         # 格式化返回结果
-        ret = future.result()
         if 'error' in ret:
+            _errors.labels(params[1], 'node').inc()
             if 'detail' in ret['error']:
                 raise RPCError(ret['error']['detail'])
             else:
@@ -129,5 +245,5 @@ class AsyncRPC(object):
                     api_id = 0
             else:
                 api_id = kwargs['api_id']
-            return await self._rpc([api_id, name, [*args]])
+            return await self._rpc([api_id, name, [*args]], kwargs.get('timeout'))
         return method
@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+
+import time
+import asyncio
+import logging
+from collections import deque
+from .pusher import Pusher
+from .cache import ChainCache
+from .rpcpool import RpcPool
+from .checkpoint import Checkpoint
+from .transferindex import TransferIndex
+from .sysconfig import SysConfig
+from .monitor import AccountState
+from .decoder import TransferDecoder
+
+class Backfill(object):
+    ''' 历史操作回填
+        :param accesses 节点地址列表
+        :param account 账户配置
+        :param connections 连接数量
+        :param window 每个窗口的操作数量
+        :param concurrency 并发窗口数量
+    '''
+    PAGE_SIZE = 100
+
+    def __init__(self, accesses, account, connections=4, window=1000, concurrency=8, loop=None):
+        self._loop = loop
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        self._window = max(1, int(window))
+        self._concurrency = max(1, int(concurrency))
+        self._pool = RpcPool(accesses, connections, self._loop)
+        self._pusher = Pusher(self._loop)
+        self._decoder = TransferDecoder()
+        self._index = TransferIndex(SysConfig().transfer_index_path)
+        checkpoint = Checkpoint(account['lastop'], SysConfig().checkpoint_interval,
+            SysConfig().checkpoint_fsync, self._loop)
+        self._state = AccountState(account['name'], account['memo_key'], checkpoint)
+
+    async def run(self, end=None):
+        ''' 执行回填, 按操作顺序推送并推进检查点
+        '''
+        state = self._state
+        client = await self._pool.get_client()
+        state.account = await ChainCache().get_account_by_name(client, state.name)
+        [statistics] = await client.get_objects([state.account['statistics']])
+        state.update_statistics(statistics)
+        start = state.op_number
+        if end is None or end > state.total_ops:
+            end = state.total_ops
+        if start > end:
+            logging.info('Account#%s has nothing to backfill', state.name)
+            return
+        logging.info('Backfill account#%s from op %d to %d', state.name, start, end)
+
+        # 窗口并发获取, 按顺序输出
+        begin = time.monotonic()
+        windows = deque()
+        next_start = start
+        while len(windows) > 0 or next_start <= end:
+            while len(windows) < self._concurrency and next_start <= end:
+                stop = min(next_start + self._window - 1, end)
+                windows.append(asyncio.ensure_future(
+                    self._fetch_window(next_start, stop), loop=self._loop))
+                next_start = stop + 1
+
+            trxs = await windows.popleft()
+            transfers = [trx for trx in trxs if not trx is None]
+            await self._index.add(transfers)
+            await self._pusher.push_many(transfers)
+            for trx in trxs:
+                if not trx is None:
+                    state.transfers += 1
+                state.op_number += 1
+                state.checkpoint.update(state.op_number)
+            await state.checkpoint.flush()
+
+            # 输出进度
+            done = state.op_number - start
+            elapsed = max(time.monotonic() - begin, 1e-6)
+            logging.info('Backfill account#%s op %d/%d, %d transfers, %.1f ops/s',
+                state.name, state.op_number - 1, end, state.transfers, done / elapsed)
+
+        # 等待通知送达
+        await self._pusher.join()
+        await self._pusher.close()
+
+    async def _fetch_window(self, start, stop):
+        ''' 获取并解码一个窗口的操作
+        '''
+        pages = []
+        for op_number in range(start, stop + 1, self.PAGE_SIZE):
+            limit = min(self.PAGE_SIZE, stop - op_number + 1)
+            pages.append(self._fetch_page(op_number, limit))
+        result = []
+        for trxs in await asyncio.gather(*pages):
+            result.extend(trxs)
+        return result
+
+    async def _fetch_page(self, op_number, limit):
+        ''' 获取并解码一页操作, 失败时换连接重试
+        '''
+        while True:
+            try:
+                client = await self._pool.get_client()
+                history = client.api_id['history']
+                operations = await client.get_relative_account_history(
+                    self._state.account['id'], op_number, limit, op_number+limit-1, api_id=history)
+                if len(operations) != limit:
+                    raise RuntimeError('Expected {0} operations, got {1}'.format(
+                        limit, len(operations)))
+                operations = operations[::-1]
+                trxs = await self._decoder.decode(client, self._state, operations)
+                if len(trxs) != len(operations):
+                    raise RuntimeError('Failed to decode operations')
+                return trxs
+            except Exception as e:
+                logging.warn('Failed to backfill op %d-%d, %s', op_number, op_number+limit-1, str(e))
+                await asyncio.sleep(1)
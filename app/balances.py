@@ -0,0 +1,63 @@
+# -*- coding:utf-8 -*-
+
+from decimal import Decimal
+from .cache import ChainCache
+
+def format_amount(amount, precision):
+    ''' 按资产精度格式化数量(精确十进制)
+    '''
+    return '{0:f}'.format(Decimal(int(amount)).scaleb(-int(precision)))
+
+class BalanceBook(object):
+    ''' 账户余额快照
+        快照版本为监控器看到的账户操作总数(total_ops), 账户有新操作时快照失效,
+        下次查询时重新获取; 账户未被监控时不使用快照
+        :param monitor 资产监控(可选)
+    '''
+
+    def __init__(self, monitor=None):
+        self.monitor = monitor
+        self._snapshots = {}
+        self._stats = {'hits': 0, 'misses': 0}
+
+    async def get(self, client, account, cached=False):
+        ''' 获取账户余额
+            :param account 账户名
+            :param cached 是否使用快照
+        '''
+        version = None
+        if cached and self.monitor is not None:
+            version = self.monitor.total_ops(account)
+        if version is not None:
+            snapshot = self._snapshots.get(account)
+            if snapshot is not None and snapshot[0] == version:
+                self._stats['hits'] += 1
+                return snapshot[1]
+            self._stats['misses'] += 1
+
+        balances = await self._fetch(client, account)
+        if version is not None:
+            self._snapshots[account] = (version, balances)
+        return balances
+
+    def statistics(self):
+        ''' 快照统计
+        '''
+        stats = dict(self._stats)
+        stats['snapshots'] = len(self._snapshots)
+        return stats
+
+    async def _fetch(self, client, account):
+        ''' 从节点获取余额, 资产合并为一次请求
+        '''
+        balances = await client.get_named_account_balances(account, [])
+        assets = await ChainCache().get_assets(client, [b['asset_id'] for b in balances])
+        result = []
+        for balance in balances:
+            asset = assets[balance['asset_id']]
+            result.append({
+                'id': asset['id'],
+                'symbol': asset['symbol'],
+                'amount': format_amount(balance['amount'], asset['precision']),
+            })
+        return result
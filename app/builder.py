@@ -1,6 +1,10 @@
 # -*- coding:utf-8 -*-
 
 from . import transactions
+from .cache import LRUCache, ChainCache
+from .chainparams import ChainParams
+from .singleton import Singleton
+from .sysconfig import SysConfig
 from bitsharesbase import operations
 from bitsharesbase.objects import Operation
 from bitsharesbase.account import PrivateKey
@@ -9,16 +13,55 @@ from bitsharesbase.signedtransactions import Signed_Transaction
 class MissingKeyError(Exception):
     pass
 
+@Singleton
+class SignerCache(object):
+    ''' 签名密钥缓存
+        缓存私钥对应的公钥和账户权限解析结果, 账户权限变化后缓存键随之变化
+    '''
+
+    def __init__(self):
+        self._pubkeys = {}
+        self._signers = LRUCache(SysConfig().cache_size, SysConfig().cache_ttl)
+
+    def pubkey(self, wifkey, prefix):
+        ''' 获取私钥对应的公钥
+        '''
+        key = (wifkey, prefix)
+        pubkey = self._pubkeys.get(key)
+        if pubkey is None:
+            pubkey = self._pubkeys[key] = str(PrivateKey(wifkey, prefix=prefix).pubkey)
+        return pubkey
+
+    def get(self, account, pubkey, permission):
+        ''' 获取已解析的签名私钥
+        '''
+        return self._signers.get(self._make_key(account, pubkey, permission))
+
+    def set(self, account, pubkey, permission, wifs):
+        ''' 缓存签名私钥
+        '''
+        self._signers.set(self._make_key(account, pubkey, permission), wifs)
+
+    def statistics(self):
+        ''' 缓存统计
+        '''
+        return self._signers.statistics()
+
+    def _make_key(self, account, pubkey, permission):
+        return (account['id'], pubkey, permission,
+            repr(account[permission]), repr(account['owner']))
+
 class Builder(dict):
     ''' 操作构建器
+        每个实例独立保存操作和签名密钥, 可并发使用
     '''
-    ops = []
-    wifs = []
-    client = None
-    available_signers = []
 
     def __init__(self, client):
+        super(Builder, self).__init__()
         self.client = client
+        self.ops = []
+        self.wifs = []
+        self.available_signers = []
 
     def json(self):
         return dict(self)
@@ -41,7 +84,7 @@ class Builder(dict):
     async def append_signer(self, account, wifkey, prefix, permission):
         ''' 添加签名
         '''
-        pubkey = PrivateKey(wifkey, prefix=prefix).pubkey
+        pubkey = SignerCache().pubkey(wifkey, prefix)
         required_treshold = account[permission]['weight_threshold']
 
         async def fetchkeys(account, perm, level=0):
@@ -49,23 +92,28 @@ class Builder(dict):
             if level > 2:
                 return r
             for authority in account[perm]['key_auths']:
-                if authority[0] == str(pubkey):
+                if authority[0] == pubkey:
                     r.append([wifkey, authority[1]])
             
             if sum([x[1] for x in r]) < required_treshold:
                 for authority in account[perm]['account_auths']:
-                    auth_account = await self.client.get_account_by_name(authority[0])
-                    r.extend(fetchkeys(auth_account, perm, level + 1))
+                    auth_account = (await ChainCache().get_accounts(
+                        self.client, [authority[0]]))[authority[0]]
+                    r.extend(await fetchkeys(auth_account, perm, level + 1))
             return r
 
         assert permission in ['active', 'owner'], 'Invalid permission'
 
-        if account not in self.available_signers:
-            keys = await fetchkeys(account, permission)
-            if permission != 'owner':
-                keys.extend(await fetchkeys(account, 'owner'))
-            self.wifs.extend([x[0] for x in keys])
-            self.available_signers.append(account)
+        if account['id'] not in self.available_signers:
+            wifs = SignerCache().get(account, pubkey, permission)
+            if wifs is None:
+                keys = await fetchkeys(account, permission)
+                if permission != 'owner':
+                    keys.extend(await fetchkeys(account, 'owner'))
+                wifs = [x[0] for x in keys]
+                SignerCache().set(account, pubkey, permission, wifs)
+            self.wifs.extend(wifs)
+            self.available_signers.append(account['id'])
 
     async def sign(self, fee_asset_id, expiration=30):
         ''' 执行签名
@@ -100,10 +148,10 @@ class Builder(dict):
     async def _construct_tx(self, fee_asset_id, expiration):
         ''' 构造转账操作
         '''
-        ops = [Operation(o) for o in list(self.ops)]
+        fees = await ChainParams().get_required_fees(self.client, list(self.ops), fee_asset_id)
+        ops = transactions.set_required_fees([Operation(o) for o in list(self.ops)], fees)
         expiration = transactions.formatTimeFromNow(expiration)
-        ops = await transactions.add_required_fees(self.client, ops, fee_asset_id)
-        ref_block_num, ref_block_prefix = await transactions.get_block_params(self.client)
+        ref_block_num, ref_block_prefix = await ChainParams().get_block_params(self.client)
         tx = Signed_Transaction(
             ref_block_num=ref_block_num,
             ref_block_prefix=ref_block_prefix,
@@ -0,0 +1,229 @@
+# -*- coding:utf-8 -*-
+
+import time
+import asyncio
+from collections import OrderedDict
+from .singleton import Singleton
+from .sysconfig import SysConfig
+from .serializer import compact_block
+
+class LRUCache(object):
+    ''' LRU缓存
+        :param maxsize 最大数量
+        :param ttl 过期时间(秒), None为永不过期
+    '''
+
+    def __init__(self, maxsize, ttl=None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        ''' 读取缓存
+        '''
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expire = item
+        if expire is not None and expire < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        ''' 写入缓存
+        '''
+        expire = None
+        if self._ttl is not None:
+            expire = time.monotonic() + self._ttl
+        self._data[key] = (value, expire)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        ''' 删除缓存
+        '''
+        item = self._data.pop(key, None)
+        if item is not None:
+            return item[0]
+
+    def clear(self):
+        ''' 清空缓存
+        '''
+        self._data.clear()
+
+    def statistics(self):
+        ''' 缓存统计
+        '''
+        return {
+            'size': len(self._data),
+            'maxsize': self._maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+@Singleton
+class ChainCache(object):
+    ''' 链上对象缓存
+    '''
+
+    def __init__(self):
+        size = SysConfig().cache_size
+        ttl = SysConfig().cache_ttl
+        self.assets = LRUCache(size, ttl)
+        self.accounts = LRUCache(size, ttl)
+        self.blocks = LRUCache(max(1, size // 10))
+        self.block_compact = SysConfig().block_compact
+
+    def set_asset(self, asset):
+        ''' 缓存资产
+        '''
+        self._replace(self.assets, asset, 'symbol')
+
+    def set_account(self, account):
+        ''' 缓存账户
+        '''
+        self._replace(self.accounts, account, 'name')
+
+    def invalidate_asset(self, asset_id):
+        ''' 资产失效
+        '''
+        self._invalidate(self.assets, asset_id, 'symbol')
+
+    def invalidate_account(self, account_id):
+        ''' 账户失效
+        '''
+        self._invalidate(self.accounts, account_id, 'name')
+
+    async def get_assets(self, client, asset_ids):
+        ''' 批量获取资产(按id)
+        '''
+        return await self._get_objects(client, self.assets, asset_ids, self.set_asset)
+
+    async def lookup_asset(self, client, symbol_or_id):
+        ''' 获取资产(按id或符号)
+        '''
+        asset = self.assets.get(symbol_or_id)
+        if asset is None:
+            asset = (await client.lookup_asset_symbols([symbol_or_id]))[0]
+            if asset is None:
+                raise ValueError('Unknown asset {0}'.format(symbol_or_id))
+            self.set_asset(asset)
+        return asset
+
+    async def lookup_assets(self, client, symbols_or_ids):
+        ''' 批量获取资产(按id或符号), 未命中部分合并为一次请求
+            :return 与参数顺序一致的资产列表
+        '''
+        result = {}
+        for symbol_or_id in set(symbols_or_ids):
+            asset = self.assets.get(symbol_or_id)
+            if asset is not None:
+                result[symbol_or_id] = asset
+        missing = list(set(symbols_or_ids) - set(result.keys()))
+        if len(missing) > 0:
+            for symbol_or_id, asset in zip(missing, await client.lookup_asset_symbols(missing)):
+                if asset is None:
+                    raise ValueError('Unknown asset {0}'.format(symbol_or_id))
+                self.set_asset(asset)
+                result[symbol_or_id] = asset
+        return [result[symbol_or_id] for symbol_or_id in symbols_or_ids]
+
+    async def get_accounts(self, client, account_ids):
+        ''' 批量获取账户(按id)
+        '''
+        return await self._get_objects(client, self.accounts, account_ids, self.set_account)
+
+    async def get_account_by_name(self, client, name):
+        ''' 获取账户(按名称)
+        '''
+        account = self.accounts.get(name)
+        if account is None:
+            account = await client.get_account_by_name(name)
+            if account is None:
+                raise ValueError('Unknown account {0}'.format(name))
+            self.set_account(account)
+        return account
+
+    async def get_blocks(self, client, block_nums, trx_indexes=None):
+        ''' 批量获取区块
+            :param trx_indexes 各区块需要的交易位置, 精简模式下只缓存这些交易(区块仍完整下载和解析)
+        '''
+        result = {}
+        for block_num in set(block_nums):
+            block = self.blocks.get(block_num)
+            if block is not None and self._has_transactions(block, block_num, trx_indexes):
+                result[block_num] = block
+        missing = sorted(set(block_nums) - set(result.keys()))
+        if len(missing) > 0:
+            blocks = await asyncio.gather(*[client.get_block(n) for n in missing])
+            for block_num, block in zip(missing, blocks):
+                if self.block_compact and trx_indexes is not None:
+                    block = compact_block(block, trx_indexes[block_num])
+                self.blocks.set(block_num, block)
+                result[block_num] = block
+        return result
+
+    def _has_transactions(self, block, block_num, trx_indexes):
+        ''' 精简区块是否包含所需交易
+        '''
+        if trx_indexes is None or not isinstance(block['transactions'], dict):
+            return True
+        return all([i in block['transactions'] for i in trx_indexes[block_num]])
+
+    def statistics(self):
+        ''' 缓存统计
+        '''
+        return {
+            'assets': self.assets.statistics(),
+            'accounts': self.accounts.statistics(),
+            'blocks': self.blocks.statistics(),
+        }
+
+    async def _get_objects(self, client, cache, object_ids, setter):
+        ''' 批量获取对象, 未命中部分合并为一次请求
+        '''
+        result = {}
+        for object_id in set(object_ids):
+            obj = cache.get(object_id)
+            if obj is not None:
+                result[object_id] = obj
+        missing = list(set(object_ids) - set(result.keys()))
+        if len(missing) > 0:
+            for obj in await client.get_objects(missing):
+                if obj is not None:
+                    setter(obj)
+                    result[obj['id']] = obj
+        return result
+
+    def _replace(self, cache, obj, alias):
+        ''' 替换缓存对象
+        '''
+        old = cache.pop(obj['id'])
+        if old is not None and old[alias] != obj[alias]:
+            cache.pop(old[alias])
+        cache.set(obj['id'], obj)
+        cache.set(obj[alias], obj)
+
+    def _invalidate(self, cache, object_id, alias):
+        ''' 删除缓存对象
+        '''
+        old = cache.pop(object_id)
+        if old is not None:
+            cache.pop(old[alias])
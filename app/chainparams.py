@@ -0,0 +1,187 @@
+# -*- coding:utf-8 -*-
+
+import time
+import struct
+import asyncio
+import logging
+from binascii import unhexlify
+from .cache import ChainCache
+from .singleton import Singleton
+from .sysconfig import SysConfig
+from bitsharesbase import operations
+from bitsharesbase.objects import Operation
+
+# 核心资产
+CORE_ASSET_ID = '1.3.0'
+
+# 手续费比例基数(100%)
+GRAPHENE_100_PERCENT = 10000
+
+def is_insufficient_fee(error):
+    ''' 是否为手续费不足错误
+    '''
+    message = str(error).lower()
+    return 'insufficient_fee' in message or 'insufficient fee' in message
+
+@Singleton
+class ChainParams(object):
+    ''' 链参数
+        后台定时刷新引用区块参数, 维护周期变化时刷新全局参数(手续费表等)
+        未启动或数据过期时通过传入的客户端直接获取
+    '''
+
+    def __init__(self):
+        self._interval = SysConfig().chain_params_interval
+        self._properties = None
+        self._updated = 0
+        self._global = None
+        self._maintenance_time = None
+        self._task = None
+        self._lock = None
+        self._remote_until = {}
+        self._stats = {
+            'refreshes': 0,
+            'global_refreshes': 0,
+            'local_fees': 0,
+            'remote_fees': 0,
+            'fee_rejections': 0,
+            'fallbacks': 0,
+            'errors': 0,
+        }
+
+    def start(self, pool, loop=None):
+        ''' 启动后台刷新
+            :param pool RPC连接池
+        '''
+        if self._task is None:
+            if loop is None:
+                loop = asyncio.get_event_loop()
+            self._task = asyncio.ensure_future(self._refresh_loop(pool), loop=loop)
+
+    def statistics(self):
+        ''' 链参数统计
+        '''
+        stats = dict(self._stats)
+        stats['age'] = time.monotonic() - self._updated if self._updated else None
+        stats['head_block_number'] = (self._properties['head_block_number']
+            if self._properties is not None else None)
+        return stats
+
+    async def refresh(self, client):
+        ''' 刷新链参数
+        '''
+        properties = await client.get_dynamic_global_properties()
+        maintenance_time = properties.get('next_maintenance_time')
+        if self._global is None or maintenance_time != self._maintenance_time:
+            self._global = (await client.get_objects(['2.0.0']))[0]
+            self._maintenance_time = maintenance_time
+            self._stats['global_refreshes'] += 1
+        self._properties = properties
+        self._updated = time.monotonic()
+        self._stats['refreshes'] += 1
+
+    async def get_dynamic_properties(self, client):
+        ''' 获取动态全局参数(对象2.1.0)
+        '''
+        if self._is_stale():
+            await self._refresh_if(client, self._is_stale)
+        return self._properties
+
+    async def get_block_params(self, client):
+        ''' 获取引用区块参数
+            :return (ref_block_num, ref_block_prefix)
+        '''
+        properties = await self.get_dynamic_properties(client)
+        ref_block_num = properties['head_block_number'] & 0xFFFF
+        ref_block_prefix = struct.unpack_from('<I', unhexlify(properties['head_block_id']), 4)[0]
+        return ref_block_num, ref_block_prefix
+
+    async def get_global_properties(self, client):
+        ''' 获取全局参数(对象2.0.0)
+        '''
+        if self._global is None:
+            await self._refresh_if(client, lambda: self._global is None)
+        return self._global
+
+    async def get_required_fees(self, client, ops, asset_id=CORE_ASSET_ID):
+        ''' 计算操作手续费, 返回结构与get_required_fees相同
+            转账操作按本地手续费表计算, 其它操作或本地结果被节点拒绝后的一段时间内请求节点
+            :param ops 操作对象列表(未包装为Operation)
+        '''
+        if not all([isinstance(op, operations.Transfer) for op in ops]) or \
+                time.monotonic() < self._remote_until.get(asset_id, 0):
+            self._stats['remote_fees'] += 1
+            return await client.get_required_fees([Operation(op).json() for op in ops], asset_id)
+
+        global_properties = await self.get_global_properties(client)
+        schedule = global_properties['parameters']['current_fees']
+        params = dict([(f[0], f[1]) for f in schedule['parameters']])[0]
+        asset = None
+        if asset_id != CORE_ASSET_ID:
+            asset = (await ChainCache().get_assets(client, [asset_id]))[asset_id]
+
+        fees = []
+        for op in ops:
+            core_fee = self._transfer_fee(op, params) * int(schedule['scale']) // GRAPHENE_100_PERCENT
+            fees.append({'amount': self._from_core(core_fee, asset), 'asset_id': asset_id})
+        self._stats['local_fees'] += 1
+        return fees
+
+    def fee_rejected(self, asset_id):
+        ''' 本地计算的手续费被节点拒绝(手续费表或兑换比例已变化)
+            丢弃缓存的资产和全局参数, cache_ttl秒内该资产的手续费改为请求节点计算
+        '''
+        self._remote_until[asset_id] = time.monotonic() + SysConfig().cache_ttl
+        self._global = None
+        ChainCache().invalidate_asset(asset_id)
+        self._stats['fee_rejections'] += 1
+
+    async def _refresh_if(self, client, condition):
+        ''' 按需刷新, 并发请求只刷新一次
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if condition():
+                self._stats['fallbacks'] += 1
+                await self.refresh(client)
+
+    def _is_stale(self):
+        ''' 引用区块参数是否过期
+        '''
+        return self._properties is None or time.monotonic() - self._updated > self._interval * 3
+
+    def _transfer_fee(self, op, params):
+        ''' 转账基础手续费(核心资产), 备注按字节收费
+            与节点一致按optional<memo_data>的序列化大小计算, 包含1字节的存在标记
+        '''
+        fee = int(params['fee'])
+        memo = op.data['memo']
+        if not memo.isempty():
+            size = len(bytes(memo))
+            fee += size * int(params['price_per_kbyte']) // 1024
+        return fee
+
+    def _from_core(self, core_fee, asset):
+        ''' 按资产的core_exchange_rate换算手续费, 向上取整
+        '''
+        if asset is None:
+            return core_fee
+        rate = asset['options']['core_exchange_rate']
+        if rate['base']['asset_id'] == CORE_ASSET_ID:
+            core, other = rate['base'], rate['quote']
+        else:
+            core, other = rate['quote'], rate['base']
+        return -(-core_fee * int(other['amount']) // int(core['amount']))
+
+    async def _refresh_loop(self, pool):
+        ''' 定时刷新
+        '''
+        while True:
+            try:
+                client = await pool.get_client()
+                await self.refresh(client)
+            except Exception as e:
+                self._stats['errors'] += 1
+                logging.warn('Failed to refresh chain parameters, %s', str(e))
+            await asyncio.sleep(self._interval)
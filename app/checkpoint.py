@@ -0,0 +1,78 @@
+# -*- coding:utf-8 -*-
+
+import os
+import yaml
+import asyncio
+import logging
+
+class Checkpoint(object):
+    ''' 操作游标检查点
+        :param path 文件路径
+        :param interval 定时写入间隔(秒)
+        :param fsync 写入后是否同步到磁盘
+    '''
+
+    def __init__(self, path, interval=1, fsync=False, loop=None):
+        self._path = path
+        self._loop = loop
+        self._fsync = fsync
+        self._interval = interval
+        self._op_number = None
+        self._flushed = None
+        self._lock = asyncio.Lock()
+        self.writes = 0
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        asyncio.ensure_future(self._flush_periodically(), loop=self._loop)
+
+    @property
+    def op_number(self):
+        return self._op_number
+
+    def load(self):
+        ''' 读取操作数量
+        '''
+        if not os.path.exists(self._path):
+            self._op_number = self._flushed = 0
+            return self._op_number
+        with open(self._path, 'rb') as handle:
+            data = yaml.load(handle)
+        self._op_number = self._flushed = data['op_number']
+        return self._op_number
+
+    def update(self, op_number):
+        ''' 更新操作数量(仅内存)
+        '''
+        self._op_number = op_number
+
+    async def flush(self):
+        ''' 写入磁盘
+        '''
+        async with self._lock:
+            op_number = self._op_number
+            if op_number is None or op_number == self._flushed:
+                return
+            await self._loop.run_in_executor(None, self._write, op_number)
+            self._flushed = op_number
+            self.writes += 1
+
+    def _write(self, op_number):
+        ''' 原子写入: 先写临时文件再重命名
+        '''
+        tmppath = self._path + '.tmp'
+        with open(tmppath, 'w') as handle:
+            yaml.dump({'op_number': op_number}, handle, default_flow_style=True)
+            handle.flush()
+            if self._fsync:
+                os.fsync(handle.fileno())
+        os.replace(tmppath, self._path)
+
+    async def _flush_periodically(self):
+        ''' 定时写入
+        '''
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.warn('Failed to write checkpoint %s, %s', self._path, str(e))
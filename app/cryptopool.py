@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import signal
+import asyncio
+from .singleton import Singleton
+from .sysconfig import SysConfig
+from .metrics import Registry
+from .memodecoder import MemoDecoder
+from bitsharesbase import operations
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from bitsharesbase.signedtransactions import Signed_Transaction
+
+# 加密计算耗时(含排队)
+_task_latency = Registry().histogram('btsmonitor_crypto_duration_seconds',
+    'Crypto task duration including executor queueing', ['task'])
+
+# 工作进程内的备注解码器, 私钥和共享密钥在进程内复用
+_memo_decoder = None
+
+def init_worker():
+    ''' 进程池子进程初始化
+        恢复SIGTERM默认处理(子进程继承了父进程停止事件循环的处理函数), 忽略SIGINT由父进程关闭进程池
+    '''
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def decode_memo(cache_size, wifkey, pubkey, prefix, nonce, message):
+    ''' 解密备注信息, 返回(明文, 是否命中共享密钥缓存)
+    '''
+    global _memo_decoder
+    if _memo_decoder is None:
+        _memo_decoder = MemoDecoder(cache_size)
+    return _memo_decoder.decode(wifkey, pubkey, prefix, nonce, message)
+
+def transaction_id(transaction, prefix):
+    ''' 计算交易ID
+    '''
+    operations.default_prefix = prefix
+    return Signed_Transaction(**transaction).id
+
+@Singleton
+class CryptoExecutor(object):
+    ''' 加密计算执行器
+        模式: process(进程池), thread(线程池), inline(事件循环内执行)
+    '''
+
+    def __init__(self):
+        self._mode = SysConfig().crypto_executor
+        self._memo_cache_size = SysConfig().memo_cache_size
+        self._memo_hits = 0
+        self._memo_misses = 0
+        workers = SysConfig().crypto_workers or os.cpu_count() or 1
+        if self._mode == 'process':
+            if sys.version_info >= (3, 7):
+                self._executor = ProcessPoolExecutor(workers, initializer=init_worker)
+            else:
+                self._executor = ProcessPoolExecutor(workers)
+        elif self._mode == 'thread':
+            self._executor = ThreadPoolExecutor(workers)
+        else:
+            self._executor = None
+
+    async def _run(self, func, *args):
+        ''' 执行计算任务
+        '''
+        if self._executor is None:
+            return func(*args)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def decode_memo(self, wifkey, pubkey, prefix, nonce, message):
+        ''' 解密备注信息
+        '''
+        with _task_latency.time('decode_memo'):
+            message, hit = await self._run(decode_memo, self._memo_cache_size,
+                wifkey, pubkey, prefix, nonce, message)
+        if hit:
+            self._memo_hits += 1
+        else:
+            self._memo_misses += 1
+        return message
+
+    async def transaction_id(self, transaction, prefix):
+        ''' 计算交易ID
+        '''
+        with _task_latency.time('transaction_id'):
+            return await self._run(transaction_id, transaction, prefix)
+
+    def statistics(self):
+        ''' 执行器统计
+        '''
+        total = self._memo_hits + self._memo_misses
+        return {
+            'mode': self._mode,
+            'memo_secret_hits': self._memo_hits,
+            'memo_secret_misses': self._memo_misses,
+            'memo_secret_hit_rate': float(self._memo_hits) / total if total else 0.0,
+        }
+
+    def shutdown(self):
+        ''' 关闭执行器, 等待子进程退出
+        '''
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
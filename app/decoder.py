@@ -0,0 +1,145 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import logging
+from .cache import ChainCache
+from .sysconfig import SysConfig
+from .cryptopool import CryptoExecutor
+from .transferindex import PENDING
+from .txresolver import TransactionResolver
+
+class TransferDecoder(object):
+    ''' 转账操作解码器
+    '''
+    TRANSFER_OPERATION = 0
+    ACCOUNT_UPDATE_OPERATION = 6
+    ASSET_UPDATE_OPERATIONS = (11, 12)
+
+    async def decode(self, client, state, operations):
+        ''' 按顺序解码一页操作, 非转账操作结果为None
+            遇到失败时停止, 返回已解码部分
+        '''
+        context = await self._prefetch_operations(client, operations)
+        trxs = await asyncio.gather(*[self._process_transfer_operations(
+            client, state, operation, context) for operation in operations],
+            return_exceptions=True)
+        result = []
+        for operation, trx in zip(operations, trxs):
+            if isinstance(trx, Exception):
+                logging.warn('Failed to get process operation#%s, %s', operation['id'], str(trx))
+                break
+            result.append(trx)
+        return result
+
+    async def _get_transaction_id(self, client, transaction):
+        ''' 获取交易ID
+        '''
+        try:
+            return await CryptoExecutor().transaction_id(
+                transaction, client.chain_params['prefix'])
+        except Exception as e:
+            logging.warn('Failed to get transaction id, %s', str(e))
+            return None
+
+    async def _prefetch_operations(self, client, operations):
+        ''' 批量预取区块和账户
+        '''
+        trx_indexes = {}
+        account_ids = set()
+        asset_ids = set()
+        for operation in operations:
+            self._invalidate_cache(operation)
+            if operation['op'][0] != self.TRANSFER_OPERATION:
+                continue
+            op = operation['op'][1]
+            trx_indexes.setdefault(operation['block_num'], set()).add(operation['trx_in_block'])
+            account_ids.update([op['to'], op['from']])
+            asset_ids.update([op['amount']['asset_id'], op['fee']['asset_id']])
+
+        cache = ChainCache()
+        if SysConfig().tx_lookup == 'block':
+            get_blocks = cache.get_blocks(client, list(trx_indexes.keys()), trx_indexes)
+        else:
+            get_blocks = TransactionResolver().resolve(client, trx_indexes)
+        blocks, accounts, assets = await asyncio.gather(
+            get_blocks,
+            cache.get_accounts(client, list(account_ids)),
+            cache.get_assets(client, list(asset_ids)))
+        return {'blocks': blocks, 'accounts': accounts, 'assets': assets}
+
+    def _invalidate_cache(self, operation):
+        ''' 账户或资产变更时清理缓存
+        '''
+        op_type, op = operation['op']
+        if op_type == self.ACCOUNT_UPDATE_OPERATION:
+            ChainCache().invalidate_account(op['account'])
+        elif op_type in self.ASSET_UPDATE_OPERATIONS:
+            ChainCache().invalidate_asset(op['asset_to_update'])
+
+    async def _process_transfer_operations(self, client, state, operation, context):
+        ''' 处理转账操作
+        '''
+        # 筛选操作类型
+        if operation['op'][0] != self.TRANSFER_OPERATION:
+            return
+
+        # 操作基本信息
+        trx = {}
+        op = operation['op'][1]
+        trx['op_id'] = operation['id']
+        trx['account'] = state.name
+        if SysConfig().confirm_irreversible:
+            trx['status'] = PENDING
+
+        # 获取区块信息
+        trx['heigth'] = operation['block_num']
+        trx['trx_in_block'] = operation['trx_in_block']
+        block_info = context['blocks'][trx['heigth']]
+        trx['timestamp'] = block_info['timestamp']
+
+        # 获取交易ID
+        trx_in_block = trx['trx_in_block']
+        transaction = block_info['transactions'][trx_in_block]
+        trx['txid'] = await self._get_transaction_id(client, transaction)
+
+        # 获取转账金额
+        asset = context['assets'][op['amount']['asset_id']]
+        trx['asset'] = asset['symbol']
+        trx['asset_id'] = op['amount']['asset_id']
+        trx['amount'] = str(float(op['amount']['amount'])/float(
+            10**int(asset['precision'])))
+
+        # 获取转账手续费
+        trx['fee'] = {}
+        fee = context['assets'][op['fee']['asset_id']]
+        trx['fee']['asset'] = fee['symbol']
+        trx['fee']['asset_id'] = op['fee']['asset_id']
+        trx['fee']['amount'] = str(float(op['fee']['amount'])/float(
+            10**int(fee['precision'])))
+
+        # 获取涉案账户
+        trx['to_id'] = op['to']
+        trx['from_id'] = op['from']
+        trx['to'] = context['accounts'][op['to']]['name']
+        trx['from'] = context['accounts'][op['from']]['name']
+
+        # 解码备注信息
+        if 'memo' in op:
+            memo = op['memo']
+            trx['nonce'] = memo['nonce']
+            try:
+                prefix = client.chain_params['prefix']
+                if trx['to_id'] == state.account['id']:
+                    pubkey = memo['from']
+                else:
+                    pubkey = memo['to']
+                trx['memo'] = await CryptoExecutor().decode_memo(
+                    state.memo_key, pubkey, prefix, memo['nonce'], memo['message'])
+            except Exception as e:
+                logging.warn('Failed to decode memo, %s, %s', operation['id'], str(e))
+                trx['memo'] = None
+        else:
+            trx['memo'] = None
+            trx['nonce'] = None
+        return trx
+
@@ -0,0 +1,48 @@
+# -*- coding:utf-8 -*-
+
+from .cache import LRUCache
+from binascii import unhexlify
+from bitsharesbase.memo import get_shared_secret, init_aes, _unpad
+from bitsharesbase.account import PublicKey, PrivateKey
+
+class MemoDecoder(object):
+    ''' 备注解码器
+        按(私钥, 对方公钥)缓存ECDH共享密钥, 每条备注只执行AES解密
+        :param maxsize 共享密钥缓存数量
+    '''
+
+    def __init__(self, maxsize=1024):
+        self._privkeys = {}
+        self._secrets = LRUCache(maxsize)
+
+    def statistics(self):
+        ''' 缓存统计
+        '''
+        return self._secrets.statistics()
+
+    def shared_secret(self, wifkey, pubkey, prefix):
+        ''' 获取共享密钥, 返回(共享密钥, 是否命中缓存)
+        '''
+        key = (wifkey, pubkey)
+        secret = self._secrets.get(key)
+        if secret is not None:
+            return secret, True
+        privkey = self._privkeys.get(wifkey)
+        if privkey is None:
+            privkey = self._privkeys[wifkey] = PrivateKey(wifkey)
+        secret = get_shared_secret(privkey, PublicKey(pubkey, prefix=prefix))
+        self._secrets.set(key, secret)
+        return secret, False
+
+    def decode(self, wifkey, pubkey, prefix, nonce, message):
+        ''' 解密备注信息, 返回(明文, 是否命中缓存)
+        '''
+        secret, hit = self.shared_secret(wifkey, pubkey, prefix)
+        aes = init_aes(secret, nonce)
+        cleartext = aes.decrypt(unhexlify(bytes(message, 'ascii')))
+        # 前4字节为校验和
+        message = cleartext[4:]
+        try:
+            return _unpad(message.decode('utf8'), 16), hit
+        except Exception:
+            raise ValueError(message)
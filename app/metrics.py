@@ -0,0 +1,197 @@
+# -*- coding:utf-8 -*-
+
+import time
+import bisect
+from .singleton import Singleton
+
+class Histogram(object):
+    ''' 延迟直方图
+        :param buckets 桶上限(秒), 升序
+    '''
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        ''' 记录一次观测值
+        '''
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def statistics(self):
+        ''' 直方图统计, 桶计数为累计值
+        '''
+        buckets = {}
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'avg': self.sum / self.count if self.count else 0.0,
+            'buckets': buckets,
+        }
+
+class Counter(object):
+    ''' 计数器
+    '''
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, value=1):
+        self.value += value
+
+class Gauge(object):
+    ''' 仪表
+    '''
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+class Timer(object):
+    ''' 计时器, 退出时记录耗时
+        :param histogram 直方图
+    '''
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._histogram.observe(time.monotonic() - self._start)
+
+class MetricFamily(object):
+    ''' 指标族, 按标签值区分子指标
+        :param name 指标名
+        :param help 说明
+        :param kind 类型: counter, gauge, histogram
+        :param labelnames 标签名
+    '''
+    FACTORIES = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+
+    def __init__(self, name, help, kind, labelnames=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+
+    def labels(self, *values):
+        ''' 获取子指标
+        '''
+        values = tuple([str(v) for v in values])
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.FACTORIES[self.kind]()
+        return child
+
+    def time(self, *values):
+        ''' 计时(仅直方图)
+        '''
+        return Timer(self.labels(*values))
+
+    def samples(self):
+        ''' 采样, 返回[(标签值, 子指标)]
+        '''
+        return list(self.children.items())
+
+class CallbackFamily(MetricFamily):
+    ''' 采集时回调获取数值的指标族
+        :param callback 返回[(标签值, 数值)]
+    '''
+
+    def __init__(self, name, help, kind, labelnames, callback):
+        super(CallbackFamily, self).__init__(name, help, kind, labelnames)
+        self._callback = callback
+
+    def samples(self):
+        result = []
+        for values, value in self._callback():
+            child = self.FACTORIES[self.kind]()
+            child.value = value
+            result.append((tuple([str(v) for v in values]), child))
+        return result
+
+def _escape(value):
+    ''' 转义标签值
+    '''
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    ''' 格式化标签
+    '''
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{' + ','.join(['{0}="{1}"'.format(k, _escape(v)) for k, v in pairs]) + '}'
+
+@Singleton
+class Registry(object):
+    ''' 指标注册表, 以Prometheus文本格式导出
+    '''
+
+    def __init__(self):
+        self._families = {}
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(MetricFamily(name, help, 'counter', labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(MetricFamily(name, help, 'gauge', labelnames))
+
+    def histogram(self, name, help, labelnames=()):
+        return self._register(MetricFamily(name, help, 'histogram', labelnames))
+
+    def callback(self, name, help, kind, labelnames, callback):
+        ''' 注册回调指标, 同名指标重复注册时替换回调
+        '''
+        family = CallbackFamily(name, help, kind, labelnames, callback)
+        self._families[name] = family
+        return family
+
+    def expose(self):
+        ''' 导出Prometheus文本格式
+        '''
+        lines = []
+        for name in sorted(self._families.keys()):
+            family = self._families[name]
+            lines.append('# HELP {0} {1}'.format(name, family.help))
+            lines.append('# TYPE {0} {1}'.format(name, family.kind))
+            for values, child in sorted(family.samples(), key=lambda x: x[0]):
+                if family.kind != 'histogram':
+                    lines.append('{0}{1} {2}'.format(
+                        name, _format_labels(family.labelnames, values), float(child.value)))
+                    continue
+                stats = child.statistics()
+                for bound, count in stats['buckets'].items():
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, _format_labels(family.labelnames, values, ('le', bound)), count))
+                labels = _format_labels(family.labelnames, values)
+                lines.append('{0}_sum{1} {2}'.format(name, labels, stats['sum']))
+                lines.append('{0}_count{1} {2}'.format(name, labels, stats['count']))
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, family):
+        ''' 注册指标族, 同名指标返回已注册的实例
+        '''
+        exists = self._families.get(family.name)
+        if exists is not None:
+            return exists
+        self._families[family.name] = family
+        return family
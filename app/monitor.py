@@ -4,12 +4,19 @@ import asyncio
 import hashlib
 import logging
 from .pusher import Pusher
+from .cache import ChainCache
+from .checkpoint import Checkpoint
+from .transferindex import TransferIndex, CONFIRMED, FAILED
+from .metrics import Registry
 from .asyncrpc import AsyncRPC
 from .sysconfig import SysConfig
-from binascii import hexlify
-from bitsharesbase import memo as BtsMemo
-from bitsharesbase.account import PublicKey, PrivateKey
-from bitsharesbase.signedtransactions import Signed_Transaction
+from .decoder import TransferDecoder
+from .cryptopool import CryptoExecutor
+from .txresolver import TransactionResolver
+
+# 各处理阶段耗时
+_stage_latency = Registry().histogram('btsmonitor_monitor_stage_duration_seconds',
+    'Monitor stage duration', ['stage'])
 
 def get_operation_id(id):
     ''' 获取操作id
@@ -21,183 +28,370 @@ def make_operation_id(id):
     '''
     return '.'.join(['1', '11', str(id)])
 
+class AccountState(object):
+    ''' 账户监控状态
+        :param name 比特股账户名
+        :param memo_key 备注私钥
+        :param checkpoint 操作游标检查点
+    '''
+
+    def __init__(self, name, memo_key, checkpoint):
+        self.name = name
+        self.memo_key = memo_key
+        self.checkpoint = checkpoint
+        self.account = None
+        self.op_number = checkpoint.load()
+        self.total_ops = 0
+        self.removed_ops = 0
+        self.pages = 0
+        self.errors = 0
+        self.transfers = 0
+        self.confirmed = 0
+        self.failed = 0
+        self.last_transfer = None
+
+    @property
+    def pending(self):
+        ''' 是否有未处理操作
+        '''
+        return self.account is not None and self.op_number <= self.total_ops
+
+    def update_statistics(self, statistics):
+        ''' 更新账户统计
+        '''
+        self.total_ops = statistics['total_ops']
+        self.removed_ops = statistics['removed_ops']
+        if self.op_number <= self.removed_ops:
+            self.op_number = self.removed_ops + 1
+
+    def statistics(self):
+        ''' 监控统计
+        '''
+        return {
+            'account': self.name,
+            'op_number': self.op_number,
+            'total_ops': self.total_ops,
+            'lag': max(0, self.total_ops - self.op_number + 1),
+            'pages': self.pages,
+            'errors': self.errors,
+            'transfers': self.transfers,
+            'confirmed': self.confirmed,
+            'failed': self.failed,
+            'last_transfer': self.last_transfer,
+        }
+
 class Monitor(object):
     ''' 资产监控
-        :param account 比特股账户名
+        :param accesses 节点地址列表
+        :param accounts 账户配置列表
     '''
-    asset_info = {}
-
-    TRANSFER_OPERATION = 0
     OPERATION_HISTORY_ID_TYPE = '1.11.0'
+    DYNAMIC_GLOBAL_PROPERTIES_ID = '2.1.0'
+    SUBSCRIBE_CALLBACK_ID = 1
+    RESYNC_INTERVAL = 30
+    POLL_INTERVAL = 10
+    PAGE_SIZE = 100
 
-    def __init__(self, access, account, loop=None):
+    def __init__(self, accesses, accounts, loop=None):
+        if isinstance(accesses, str):
+            accesses = [accesses]
         self._loop = loop
-        self._account = None
-        self._access = access
-        self._account_name = account
-        self._last_relative_position = 0
-        self._pusher = Pusher(self._loop)
+        self._accesses = list(accesses)
+        self._access_index = 0
         if self._loop is None:
             self._loop = asyncio.get_event_loop()
-        asyncio.ensure_future(
-            self._listen_for_activity(), loop=self._loop)
+        self._pusher = Pusher(self._loop)
+        self._decoder = TransferDecoder()
+        self._index = TransferIndex(SysConfig().transfer_index_path)
+        self._confirm = SysConfig().confirm_irreversible
+        self._irreversible = 0
+        self._states = []
+        for account in accounts:
+            checkpoint = Checkpoint(account['lastop'], SysConfig().checkpoint_interval,
+                SysConfig().checkpoint_fsync, self._loop)
+            self._states.append(AccountState(account['name'], account['memo_key'], checkpoint))
+        self._changed = asyncio.Event()
+        self._register_metrics()
+        asyncio.ensure_future(self._run(), loop=self._loop)
+
+    @property
+    def pusher(self):
+        ''' 通知推送器
+        '''
+        return self._pusher
+
+    def statistics(self):
+        ''' 各账户监控统计
+        '''
+        return [state.statistics() for state in self._states]
+
+    def _register_metrics(self):
+        ''' 注册各账户监控指标
+        '''
+        def collect(getter):
+            return lambda: [((s.name,), getter(s)) for s in self._states]
+        registry = Registry()
+        registry.callback('btsmonitor_monitor_lag_operations', 'Operations not yet processed',
+            'gauge', ['account'], collect(lambda s: max(0, s.total_ops - s.op_number + 1)))
+        registry.callback('btsmonitor_monitor_op_number', 'Next operation number to process',
+            'gauge', ['account'], collect(lambda s: s.op_number))
+        registry.callback('btsmonitor_monitor_total_ops', 'Account total operations',
+            'gauge', ['account'], collect(lambda s: s.total_ops))
+        registry.callback('btsmonitor_monitor_transfers_total', 'Transfers pushed',
+            'counter', ['account'], collect(lambda s: s.transfers))
+        registry.callback('btsmonitor_monitor_errors_total', 'Monitor errors',
+            'counter', ['account'], collect(lambda s: s.errors))
+        registry.callback('btsmonitor_monitor_confirmed_total', 'Transfers confirmed irreversible',
+            'counter', ['account'], collect(lambda s: s.confirmed))
+        registry.callback('btsmonitor_monitor_irreversible_block', 'Last irreversible block number',
+            'gauge', [], lambda: [((), self._irreversible)])
+
+    def total_ops(self, name):
+        ''' 账户操作总数, 账户未被监控或统计未就绪时返回None
+        '''
+        for state in self._states:
+            if state.name == name and state.account is not None and state.total_ops > 0:
+                return state.total_ops
+        return None
 
-    async def _get_history_operation(self, client, op_number, limit):
+    async def _get_history_operation(self, client, account_id, op_number, limit):
         ''' 获取历史操作
         '''
         history = client.api_id['history']
         operations = await client.get_relative_account_history(
-            self._account['id'], op_number, limit, op_number+limit, api_id=history)
+            account_id, op_number, limit, op_number+limit-1, api_id=history)
         return operations
 
-    async def _get_asset_info(self, client, asset_id):
-        ''' 获取资产信息
+    async def _process_page(self, client, state):
+        ''' 获取并处理一页操作, 返回是否有进展
         '''
-        if asset_id not in self.asset_info:
-            asset = (await client.get_objects([asset_id]))[0]
-            self.asset_info[asset_id] = asset
-            self.asset_info[asset['symbol']] = asset
-        return self.asset_info[asset_id]
+        # 获取历史操作
+        try:
+            with _stage_latency.time('fetch'):
+                operations = await self._get_history_operation(
+                    client, state.account['id'], state.op_number, self.PAGE_SIZE)
+            if len(operations) == 0:
+                return False
+        except Exception as e:
+            state.errors += 1
+            logging.warn('Failed to get history operation of account#%s, %s', state.name, str(e))
+            return False
 
-    async def _get_transaction_id(self, transaction):
-        ''' 获取交易ID
-        '''
+        # 解码转账操作
+        operations = operations[::-1]
+        try:
+            with _stage_latency.time('decode'):
+                trxs = await self._decoder.decode(client, state, operations)
+        except Exception as e:
+            state.errors += 1
+            logging.warn('Failed to prefetch operations, %s', str(e))
+            return False
+        if len(trxs) < len(operations):
+            state.errors += 1
+
+        # 写入转账索引
+        transfers = [trx for trx in trxs if not trx is None]
+        try:
+            with _stage_latency.time('index'):
+                await self._index.add(transfers)
+        except Exception as e:
+            state.errors += 1
+            logging.warn('Failed to write transfer index, %s', str(e))
+            return False
+
+        # 推送转账操作(每页一个发件箱事务)
+        for trx in transfers:
+            logging.info('New transfer operation: %s', trx)
         try:
-            tx = Signed_Transaction(**transaction)
-            return tx.id
+            with _stage_latency.time('push'):
+                await self._pusher.push_many(transfers)
         except Exception as e:
-            logging.warn('Failed to get transaction id, %s', str(e))
-            return None
+            state.errors += 1
+            logging.warn('Failed to write outbox, %s', str(e))
+            return False
+        last_op_number = state.op_number
+        for trx in trxs:
+            if not trx is None:
+                state.transfers += 1
+                state.last_transfer = trx['timestamp']
+            state.op_number += 1
+            state.checkpoint.update(state.op_number)
+        state.pages += 1
 
-    async def _process_transfer_operations(self, client, operation):
-        ''' 处理转账操作
+        # 每页写入一次检查点
+        try:
+            with _stage_latency.time('checkpoint'):
+                await state.checkpoint.flush()
+        except Exception as e:
+            logging.warn('Failed to write checkpoint, %s', str(e))
+        logging.info('Account#%s current op number: %d', state.name, state.op_number)
+        return state.op_number > last_op_number
+
+    async def _confirm_transfers(self, client):
+        ''' 确认所在区块已不可逆的转账, 推送confirmed事件
+            从节点重新获取(区块号, 位置)处的交易并比对交易ID, 不一致(分叉被丢弃)时推送failed事件
         '''
-        # 筛选操作类型
-        if operation['op'][0] != self.TRANSFER_OPERATION:
+        if not self._confirm:
             return
+        states = dict([(s.name, s) for s in self._states])
+        prefix = client.chain_params['prefix']
+        while True:
+            trxs = self._index.pending(self._irreversible, self.PAGE_SIZE)
+            if len(trxs) == 0:
+                return
+            with _stage_latency.time('confirm'):
+                positions = sorted(set([(trx['heigth'], trx['trx_in_block']) for trx in trxs]))
+                transactions = await TransactionResolver().refresh(client, positions)
+                found = [(p, t) for p, t in zip(positions, transactions) if t is not None]
+                txids = await asyncio.gather(
+                    *[CryptoExecutor().transaction_id(t, prefix) for _, t in found],
+                    return_exceptions=True)
+                txids = dict(zip([p for p, _ in found], txids))
+                for trx in trxs:
+                    position = (trx['heigth'], trx['trx_in_block'])
+                    txid = txids.get(position)
+                    if isinstance(txid, Exception):
+                        # 序列化库不支持的交易无法计算ID, 解码时同样未能计算的只校验交易是否存在
+                        confirmed = trx['txid'] is None
+                    else:
+                        # 解码时未能计算交易ID的转账只校验交易是否存在
+                        confirmed = position in txids and trx['txid'] in (txid, None)
+                    if confirmed:
+                        trx['status'] = CONFIRMED
+                    else:
+                        trx['status'] = FAILED
+                        logging.warn('Transfer %s not found in irreversible block %d',
+                            trx['op_id'], trx['heigth'])
+                    state = states.get(trx['account'])
+                    if state is not None:
+                        if trx['status'] == CONFIRMED:
+                            state.confirmed += 1
+                        else:
+                            state.failed += 1
+                await self._pusher.push_many(trxs)
+                await self._index.set_status(trxs)
 
-        # 操作基本信息
-        trx = {}
-        op = operation['op'][1]
-        
-        # 获取区块信息
-        trx['heigth'] = operation['block_num']  
-        block_info = await client.get_block(trx['heigth'])
-        trx['timestamp'] = block_info['timestamp']
-
-        # 获取交易ID
-        trx_in_block = operation['trx_in_block']
-        transaction = block_info['transactions'][trx_in_block]
-        trx['txid'] = await self._get_transaction_id(transaction)
-        
-        # 获取转账金额
-        asset = await self._get_asset_info(client, op['amount']['asset_id'])
-        trx['asset'] = asset['symbol']
-        trx['asset_id'] = op['amount']['asset_id']
-        trx['amount'] = str(float(op['amount']['amount'])/float(
-            10**int(asset['precision'])))
-        
-        # 获取转账手续费
-        trx['fee'] = {}
-        fee = await self._get_asset_info(client, op['fee']['asset_id'])
-        trx['fee']['asset'] = fee['symbol']
-        trx['fee']['asset_id'] = op['fee']['asset_id']
-        trx['fee']['amount'] = str(float(op['fee']['amount'])/float(
-            10**int(fee['precision'])))
-       
-        # 获取涉案账户
-        trx['to_id'] = op['to']
-        trx['from_id'] = op['from']
-        trx['to'] = (await client.get_objects([op['to']]))[0]['name']
-        trx['from'] = (await client.get_objects([op['from']]))[0]['name']
-        
-        # 解码备注信息
-        if 'memo' in op:
-            memo = op['memo']
-            trx['nonce'] = memo['nonce']
-            try:
-                privkey = PrivateKey(SysConfig().memo_key)
-                prefix = client.chain_params['prefix']
-                if trx['to_id'] == self._account['id']:
-                    pubkey = PublicKey(memo['from'], prefix=prefix)
-                else:
-                    pubkey = PublicKey(memo['to'], prefix=prefix)
-                trx['memo'] = BtsMemo.decode_memo(
-                    privkey, pubkey, memo['nonce'], memo['message'])
-            except Exception as e:
-                logging.warn('Failed to decode memo, %s, %s', operation['id'], str(e))
-                trx['memo'] = None
-        else:
-            trx['memo'] = None
-            trx['nonce'] = None
-        return trx
+    def _update_irreversible(self, properties):
+        ''' 更新最新不可逆区块高度
+        '''
+        block_num = properties['last_irreversible_block_num']
+        if block_num > self._irreversible:
+            self._irreversible = block_num
+            self._changed.set()
 
-    async def _get_and_process_operations(self, client, op_number):
-        ''' 获取并处理操作
+    async def _connect(self):
+        ''' 建立连接, 失败时轮换节点
         '''
         while True:
-            # 获取历史操作
-            operations = None
-            try:
-                operations = await self._get_history_operation(client, op_number, 100)
-                if len(operations) == 0:
-                    break
-            except Exception as e:
-                logging.warn('Failed to get history operation, %s', str(e))
-                break
-
-            # 处理转账操作
-            index = 0
-            operations = operations[::-1]
-            while index < len(operations):
-                operation = operations[index]
+            access = self._accesses[self._access_index % len(self._accesses)]
+            self._access_index += 1
+            client = AsyncRPC(access, self._loop,
+                SysConfig().rpc_timeout, SysConfig().rpc_max_inflight)
+            if await client.wait_for_ready():
+                return client
+            logging.warn('Failed to connect %s', access)
+            await client.close()
+            await asyncio.sleep(3)
+
+    def _on_notice(self, notices):
+        ''' 账户统计变更通知
+        '''
+        states = dict([(s.account['statistics'], s) for s in self._states
+            if s.account is not None])
+        for notice in notices:
+            for obj in notice if isinstance(notice, list) else [notice]:
+                if isinstance(obj, dict) and obj.get('id') in states:
+                    states[obj['id']].update_statistics(obj)
+                    self._changed.set()
+                elif isinstance(obj, dict) and obj.get('id') == self.DYNAMIC_GLOBAL_PROPERTIES_ID:
+                    self._update_irreversible(obj)
+
+    async def _resolve_accounts(self, client):
+        ''' 获取账户信息
+        '''
+        for state in self._states:
+            if state.account is None:
                 try:
-                    trx = await self._process_transfer_operations(client, operation)
-                    if not trx is None:
-                        logging.info('New transfer operation: %s', trx)
-                        self._pusher.async_call(trx)
-                    index += 1
-                    op_number += 1
-                    SysConfig().update_last_op_number(op_number)
+                    state.account = await ChainCache().get_account_by_name(client, state.name)
                 except Exception as e:
-                    logging.warn('Failed to get process operation#%s, %s', operation['id'], str(e))
-                    continue
-        return op_number
+                    logging.warn('Failed to get account#%s by name, %s', state.name, str(e))
+
+    async def _refresh_statistics(self, client):
+        ''' 获取账户统计(订阅模式下同时订阅对象变更)
+            等待不可逆确认时一并获取(订阅)动态全局参数, 跟踪不可逆区块高度
+        '''
+        await self._resolve_accounts(client)
+        states = [s for s in self._states if s.account is not None]
+        if len(states) == 0:
+            return
+        ids = [s.account['statistics'] for s in states]
+        if self._confirm:
+            ids.append(self.DYNAMIC_GLOBAL_PROPERTIES_ID)
+        objects = await client.get_objects(ids)
+        for state, statistics in zip(states, objects):
+            state.update_statistics(statistics)
+        if self._confirm:
+            self._update_irreversible(objects[-1])
+
+    async def _wait_for_notice(self, client, timeout):
+        ''' 等待统计变更通知或连接断开
+        '''
+        waiter = asyncio.ensure_future(self._changed.wait(), loop=self._loop)
+        closed = asyncio.ensure_future(client.wait_for_closed(), loop=self._loop)
+        _, pending = await asyncio.wait([waiter, closed],
+            timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        return closed.done()
 
-    async def _listen_for_activity(self):
+    async def _run(self):
         ''' 监听账户活动
         '''
-        op_number = SysConfig().get_last_op_number()
+        poll = SysConfig().monitor_mode == 'poll'
         while True:
-            # 创建客户端
-            client = AsyncRPC(self._access, self._loop)
-            if not await client.wait_for_ready():
+            # 创建客户端并订阅
+            client = await self._connect()
+            try:
+                if not poll:
+                    client.subscribe(self.SUBSCRIBE_CALLBACK_ID, self._on_notice)
+                    await client.set_subscribe_callback(self.SUBSCRIBE_CALLBACK_ID, False)
+                await self._refresh_statistics(client)
+            except Exception as e:
+                logging.warn('Failed to subscribe statistics objects, %s', str(e))
+                await client.close()
+                await asyncio.sleep(3)
                 continue
 
-            # 获取账户信息
-            if self._account is None:
+            while True:
                 try:
-                    self._account = await client.get_account_by_name(self._account_name)
-                except Exception as e:
-                    logging.warn('Failed to get account by name, %s', str(e))
-                    continue
+                    # 轮流处理各账户, 每个账户每轮一页, 避免追赶中的账户阻塞其它账户
+                    self._changed.clear()
+                    progressed = False
+                    for state in self._states:
+                        if state.pending and await self._process_page(client, state):
+                            progressed = True
 
-            # 获取账户统计
-            try:
-                [statistics] = await client.get_objects([self._account['statistics']])
-                if op_number <= statistics['removed_ops']:
-                    op_number = statistics['removed_ops'] + 1
-                if op_number > statistics['total_ops']:
-                    await client.close()
-                    await asyncio.sleep(10)
-                    continue
-            except Exception as e:
-                logging.warn('Failed to get statistics#%s object, %s', self._account['statistics'], str(e))
-                continue
+                    # 确认不可逆转账
+                    try:
+                        await self._confirm_transfers(client)
+                    except Exception as e:
+                        logging.warn('Failed to confirm transfers, %s', str(e))
+                    if progressed:
+                        continue
 
-            # 获取并处理操作
-            op_number = await self._get_and_process_operations(client, op_number)
+                    # 等待变更通知
+                    timeout = self.POLL_INTERVAL if poll else self.RESYNC_INTERVAL
+                    if await self._wait_for_notice(client, timeout):
+                        break
+                    if poll or not self._changed.is_set():
+                        try:
+                            await self._refresh_statistics(client)
+                        except Exception as e:
+                            logging.warn('Failed to get statistics objects, %s', str(e))
+                except Exception as e:
+                    # 兜底: 任何未预期的错误都不能结束监控任务
+                    logging.warn('Unexpected monitor error, %s', str(e))
+                    await asyncio.sleep(3)
 
             # 关闭客户端
             await client.close()
-            logging.info('Account#%s current op number: %d', self._account_name, op_number)
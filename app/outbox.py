@@ -0,0 +1,76 @@
+# -*- coding:utf-8 -*-
+
+import json
+import time
+from .sqlitestore import SQLiteStore
+
+class Outbox(SQLiteStore):
+    ''' 持久化发件箱
+        :param path 数据库路径
+    '''
+
+    def __init__(self, path):
+        super(Outbox, self).__init__(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'key TEXT PRIMARY KEY, '
+            'payload TEXT NOT NULL, '
+            'created REAL NOT NULL, '
+            'delivered REAL, '
+            'attempts INTEGER NOT NULL DEFAULT 0)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS outbox_delivered ON outbox (delivered, created)')
+
+    async def add_many(self, items):
+        ''' 批量写入通知(单个事务)
+            :param items [(幂等键, 通知)]
+            :return 与参数顺序一致的是否新写入列表, 已存在时为False
+        '''
+        rows = [(key, json.dumps(trx), time.time()) for key, trx in items]
+        return await self._write(self._add_many, rows)
+
+    def _add_many(self, conn, rows):
+        result = []
+        for row in rows:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO outbox (key, payload, created) VALUES (?, ?, ?)', row)
+            result.append(cursor.rowcount == 1)
+        return result
+
+    def pending(self):
+        ''' 获取未送达通知
+        '''
+        cursor = self._conn.execute(
+            'SELECT key, payload FROM outbox WHERE delivered IS NULL ORDER BY created')
+        return [(key, json.loads(payload)) for key, payload in cursor.fetchall()]
+
+    async def mark_delivered(self, keys):
+        ''' 标记已送达并记录投递次数
+        '''
+        now = time.time()
+        await self._write(lambda conn: conn.executemany(
+            'UPDATE outbox SET delivered = ?, attempts = attempts + 1 WHERE key = ?',
+            [(now, key) for key in keys]))
+
+    async def mark_failed(self, keys):
+        ''' 记录失败的投递次数
+        '''
+        await self._write(lambda conn: conn.executemany(
+            'UPDATE outbox SET attempts = attempts + 1 WHERE key = ?',
+            [(key,) for key in keys]))
+
+    def purge(self, retention):
+        ''' 清理过期的已送达通知
+        '''
+        self._conn.execute(
+            'DELETE FROM outbox WHERE delivered IS NOT NULL AND delivered < ?',
+            (time.time() - retention,))
+
+    def statistics(self):
+        ''' 发件箱统计
+        '''
+        (pending,) = self._conn.execute(
+            'SELECT COUNT(*) FROM outbox WHERE delivered IS NULL').fetchone()
+        (delivered,) = self._conn.execute(
+            'SELECT COUNT(*) FROM outbox WHERE delivered IS NOT NULL').fetchone()
+        return {'pending': pending, 'delivered': delivered}
@@ -1,38 +1,209 @@
 # -*- coding:utf-8 -*-
 
+import time
+import random
 import aiohttp
 import asyncio
 import logging
-from collections import deque
+from .outbox import Outbox
+from .transferindex import CONFIRMED, FAILED
+from .metrics import Registry
 from .sysconfig import SysConfig
 
+# 推送请求耗时和结果
+_post_latency = Registry().histogram('btsmonitor_pusher_post_duration_seconds',
+    'Webhook POST duration by result', ['result'])
+_wait_latency = Registry().histogram('btsmonitor_pusher_queue_wait_seconds',
+    'Time notifications spend in the push queue')
+
+def make_idempotency_key(trx):
+    ''' 生成幂等键, 包含监控账户(监控账户之间的转账每个账户各推送一次), 确认和失败事件附加状态
+    '''
+    key = '{0}:{1}:{2}'.format(trx['txid'], trx['op_id'], trx['account'])
+    if trx.get('status') in (CONFIRMED, FAILED):
+        key = '{0}:{1}'.format(key, trx['status'])
+    return key
+
 class Pusher(object):
     ''' 通知推送器
     '''
-    
+
     def __init__(self, loop=None):
         self._loop = loop
-        self._message_queue = deque()
+        self._session = None
+        self._outbox = Outbox(SysConfig().outbox_path)
+        self._queue = asyncio.Queue(maxsize=SysConfig().queue_size)
+        self._stats = {
+            'requests': 0,
+            'pushed': 0,
+            'replayed': 0,
+            'duplicated': 0,
+            'delivered': 0,
+            'failed': 0,
+            'blocked': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'post_time': 0.0,
+            'max_post_time': 0.0,
+        }
         if self._loop is None:
             self._loop = asyncio.get_event_loop()
+        self._outbox.purge(SysConfig().outbox_retention)
+        Registry().callback('btsmonitor_pusher_queue_size', 'Notifications waiting in the push queue',
+            'gauge', [], lambda: [((), self._queue.qsize())])
+        Registry().callback('btsmonitor_pusher_outbox_pending', 'Undelivered notifications in the outbox',
+            'gauge', [], lambda: [((), self._outbox.statistics()['pending'])])
+        Registry().callback('btsmonitor_pusher_delivered_total', 'Delivered notifications',
+            'counter', [], lambda: [((), self._stats['delivered'])])
+        asyncio.ensure_future(self._replay(self._outbox.pending()), loop=self._loop)
         for _ in range(SysConfig().workernum):
-            asyncio.ensure_future(self._do_work())
+            asyncio.ensure_future(self._do_work(), loop=self._loop)
+
+    async def push(self, trx):
+        ''' 推送通知
+        '''
+        await self.push_many([trx])
+
+    async def push_many(self, trxs):
+        ''' 批量推送通知, 先在单个事务中写入发件箱再入队, 队列已满时等待
+        '''
+        items = [(make_idempotency_key(trx), trx) for trx in trxs]
+        if len(items) == 0:
+            return
+        added = await self._outbox.add_many(items)
+        for (key, trx), created in zip(items, added):
+            if not created:
+                self._stats['duplicated'] += 1
+                continue
+            self._stats['pushed'] += 1
+            await self._enqueue(key, trx)
 
-    def async_call(self, trx):
-        ''' 异步调用
+    async def _enqueue(self, key, trx):
+        ''' 加入推送队列
         '''
-        self._message_queue.append(trx)
-    
+        if self._queue.full():
+            self._stats['blocked'] += 1
+        await self._queue.put((time.monotonic(), key, trx))
+
+    async def _replay(self, pending):
+        ''' 重新推送未送达通知
+        '''
+        if len(pending) > 0:
+            logging.info('Replaying %d undelivered notifications', len(pending))
+        for key, trx in pending:
+            self._stats['replayed'] += 1
+            await self._enqueue(key, trx)
+
+    def statistics(self):
+        ''' 推送统计
+        '''
+        stats = dict(self._stats)
+        done = stats['delivered']
+        stats['depth'] = self._queue.qsize()
+        stats['maxsize'] = self._queue.maxsize
+        stats['workernum'] = SysConfig().workernum
+        stats['outbox'] = self._outbox.statistics()
+        stats['avg_wait_time'] = stats['wait_time'] / done if done else 0.0
+        stats['avg_post_time'] = stats['post_time'] / done if done else 0.0
+        return stats
+
+    async def join(self):
+        ''' 等待队列中的通知全部送达
+        '''
+        await self._queue.join()
+
+    async def close(self):
+        ''' 关闭连接
+        '''
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        ''' 获取长连接会话
+        '''
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=SysConfig().workernum, loop=self._loop)
+            self._session = aiohttp.ClientSession(connector=connector, loop=self._loop)
+        return self._session
+
+    async def _next_batch(self):
+        ''' 获取一批通知
+        '''
+        batch = [await self._queue.get()]
+        batch_size = SysConfig().batch_size
+        deadline = time.monotonic() + SysConfig().batch_interval / 1000.0
+        while len(batch) < batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _post(self, keys, payload):
+        ''' 投递通知, 非2xx响应视为失败
+        '''
+        headers = {'Idempotency-Key': ','.join(keys)}
+        session = self._get_session()
+        async with session.post(SysConfig().webhook, json=payload, headers=headers) as resp:
+            if resp.status < 200 or resp.status >= 300:
+                raise RuntimeError('Unexpected status {0}'.format(resp.status))
+
+    async def _deliver(self, keys, payload):
+        ''' 投递通知, 失败时指数退避重试直至成功
+        '''
+        delay = SysConfig().retry_interval
+        while True:
+            start = time.monotonic()
+            result = 'error'
+            try:
+                await self._post(keys, payload)
+                await self._outbox.mark_delivered(keys)
+                result = 'ok'
+                return
+            except Exception as e:
+                self._stats['failed'] += len(keys)
+                logging.warn('Failed to post notify: %s, %s, retry in %ss', keys, str(e), delay)
+                try:
+                    await self._outbox.mark_failed(keys)
+                except Exception as e:
+                    logging.warn('Failed to update outbox, %s', str(e))
+            finally:
+                post_time = time.monotonic() - start
+                _post_latency.labels(result).observe(post_time)
+                self._stats['requests'] += 1
+                self._stats['post_time'] += post_time * len(keys)
+                self._stats['max_post_time'] = max(self._stats['max_post_time'], post_time)
+            await asyncio.sleep(delay / 2.0 + random.uniform(0, delay / 2.0))
+            delay = min(delay * 2, SysConfig().retry_max_interval)
+
     async def _do_work(self):
         ''' 工作协程
         '''
         while True:
-            if len(self._message_queue) == 0:
-                await asyncio.sleep(0.001)
-                continue
-            trx = self._message_queue.popleft()
+            batch = await self._next_batch()
+            start = time.monotonic()
+            for enqueued, _, _ in batch:
+                wait_time = start - enqueued
+                _wait_latency.labels().observe(wait_time)
+                self._stats['wait_time'] += wait_time
+                self._stats['max_wait_time'] = max(self._stats['max_wait_time'], wait_time)
+
+            # 批量模式推送数组
+            keys = [key for _, key, _ in batch]
+            trxs = [trx for _, _, trx in batch]
+            payload = trxs if SysConfig().batch_size > 1 else trxs[0]
             try:
-                async with aiohttp.ClientSession() as session:
-                    await session.post(SysConfig().webhook, json=trx)
-            except Exception as e:
-                logging.warn('Failed to post notify: %s, %s', trx, str(e))
+                await self._deliver(keys, payload)
+                self._stats['delivered'] += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,122 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import logging
+from .asyncrpc import AsyncRPC, RPCError
+from .sysconfig import SysConfig
+
+class RpcPool(object):
+    ''' RPC连接池
+        :param accesses 节点地址列表
+        :param size 连接数量
+    '''
+
+    def __init__(self, accesses, size, loop=None, heartbeat=30, retry_interval=3):
+        if isinstance(accesses, str):
+            accesses = [accesses]
+        self._loop = loop
+        self._accesses = list(accesses)
+        self._size = max(1, int(size))
+        self._heartbeat = heartbeat
+        self._retry_interval = retry_interval
+        self._clients = [None] * self._size
+        self._cursor = 0
+        self._access_index = 0
+        self._ready = asyncio.Event()
+        self._stats = {
+            'requests': 0,
+            'waits': 0,
+            'wait_timeouts': 0,
+            'connects': 0,
+            'connect_failures': 0,
+            'reconnects': 0,
+            'heartbeat_failures': 0,
+        }
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        for index in range(self._size):
+            asyncio.ensure_future(self._maintain(index), loop=self._loop)
+
+    async def get_client(self, timeout=None):
+        ''' 获取可用连接, 超时(默认rpc_timeout)仍无可用连接时抛出RPCError
+        '''
+        self._stats['requests'] += 1
+        if timeout is None:
+            timeout = SysConfig().rpc_timeout
+        deadline = self._loop.time() + timeout
+        while True:
+            for _ in range(self._size):
+                self._cursor = (self._cursor + 1) % self._size
+                client = self._clients[self._cursor]
+                if client is not None and client.is_ready:
+                    return client
+            self._stats['waits'] += 1
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), max(0, deadline - self._loop.time()))
+            except asyncio.TimeoutError:
+                self._stats['wait_timeouts'] += 1
+                raise RPCError('No node connection available after {0}s'.format(timeout))
+
+    def statistics(self):
+        ''' 连接池统计
+        '''
+        stats = dict(self._stats)
+        stats['size'] = self._size
+        stats['ready'] = len([c for c in self._clients if c is not None and c.is_ready])
+        stats['endpoints'] = {}
+        for access in self._accesses:
+            stats['endpoints'][access] = len([c for c in self._clients
+                if c is not None and c.is_ready and c.access == access])
+        return stats
+
+    def _next_access(self):
+        ''' 轮换节点地址
+        '''
+        access = self._accesses[self._access_index % len(self._accesses)]
+        self._access_index += 1
+        return access
+
+    async def _heartbeat_check(self, client):
+        ''' 心跳检测
+        '''
+        try:
+            await client.get_dynamic_global_properties(timeout=self._heartbeat)
+            return True
+        except Exception as e:
+            self._stats['heartbeat_failures'] += 1
+            logging.warn('Pool connection %s heartbeat failed, %s', client.access, str(e))
+            return False
+
+    async def _maintain(self, index):
+        ''' 维护连接
+        '''
+        while True:
+            # 建立连接
+            access = self._next_access()
+            client = AsyncRPC(access, self._loop,
+                SysConfig().rpc_timeout, SysConfig().rpc_max_inflight)
+            if not await client.wait_for_ready():
+                self._stats['connect_failures'] += 1
+                logging.warn('Pool failed to connect %s', access)
+                await client.close()
+                await asyncio.sleep(self._retry_interval)
+                continue
+            self._stats['connects'] += 1
+            self._clients[index] = client
+            self._ready.set()
+
+            # 保持连接
+            while True:
+                try:
+                    await asyncio.wait_for(client.wait_for_closed(), self._heartbeat)
+                    break
+                except asyncio.TimeoutError:
+                    if not await self._heartbeat_check(client):
+                        await client.close()
+                        break
+
+            # 断线重连
+            self._clients[index] = None
+            self._stats['reconnects'] += 1
+            logging.warn('Pool connection %s lost, reconnecting', access)
@@ -1,98 +1,280 @@
 # -*- coding:utf-8 -*-
 
+import time
 import asyncio
+import functools
 from aiohttp import web
-from .asyncrpc import AsyncRPC
+from .cache import ChainCache
+from .balances import BalanceBook
+from .chainparams import ChainParams
+from .asyncrpc import latency_statistics, RPCError
+from .serializer import Serializer
+from .txresolver import TransactionResolver
+from .cryptopool import CryptoExecutor
 from .transfer import Transfer
+from .transferindex import TransferIndex
+from .monitor import get_operation_id
 from .sysconfig import SysConfig
+from .metrics import Registry
 from jsonrpcserver.aio import methods
 
+# JSON-RPC方法耗时和错误
+_method_latency = Registry().histogram('btsmonitor_jsonrpc_duration_seconds',
+    'JSON-RPC method duration', ['method'])
+_method_errors = Registry().counter('btsmonitor_jsonrpc_errors_total',
+    'JSON-RPC method errors', ['method'])
+
+def instrument(func):
+    ''' 记录JSON-RPC方法耗时和错误
+    '''
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            _method_errors.labels(func.__name__).inc()
+            raise
+        finally:
+            _method_latency.labels(func.__name__).observe(time.monotonic() - start)
+    return wrapper
+
 @methods.add
+@instrument
 async def account(context):
     ''' 账户信息
     '''
     return SysConfig().account
 
 @methods.add
-async def get_balances(context):
+@instrument
+async def get_balances(cached=False, context=None):
     ''' 获取余额
+        :param cached 使用监控器维护的余额快照
     '''
-    result = []
-    client = context['client']
     server = context['server']
-    balances = await client.get_named_account_balances(SysConfig().account, [])
-    for asset in balances:
-        asset_info = await server.get_asset_info(client, asset['asset_id'])
-        result.append({
-            'id': asset_info['id'],
-            'symbol': asset_info['symbol'],
-            'amount': str(float(asset['amount'])/float(10**int(asset_info['precision'])))
-        })
-    return result
+    return await server.balances.get(context['client'], SysConfig().account, cached)
 
 @methods.add
-async def transfer(to, symbol_or_id, amount, memo, context):
+@instrument
+async def transfer(to, symbol_or_id, amount, memo, idempotency_key=None, context=None):
     ''' 资产转账
+        提现引擎运行时提交任务后立即返回任务信息, 否则同步转账并返回txid
     '''
     client = context['client']
     server = context['server']
-    account = await server.account_info(client)
     asset = await server.get_asset_info(client, symbol_or_id)
+    if server.withdrawals is not None:
+        return await server.withdrawals.submit(idempotency_key, to, asset, amount, memo)
+    account = await server.account_info(client)
     transfer = Transfer(client, account)
-    return await transfer.send_to(to, asset, float(amount), memo)
+    return await transfer.send_to(to, asset, amount, memo)
 
 @methods.add
+@instrument
+async def get_withdrawal(job_id, context):
+    ''' 查询提现任务
+    '''
+    withdrawals = context['server'].withdrawals
+    if withdrawals is None:
+        raise RuntimeError('Withdrawal engine is not running in this process')
+    job = withdrawals.get(job_id)
+    if job is None:
+        raise ValueError('Unknown withdrawal {0}'.format(job_id))
+    return job
+
+@methods.add
+@instrument
+async def batch_transfer(transfers : list, context):
+    ''' 批量资产转账
+        提现引擎运行时逐笔提交任务(支持幂等键)并返回任务信息, 由引擎合并签名;
+        否则同步打包转账并返回txid, 同步模式重试可能重复转账
+    '''
+    client = context['client']
+    server = context['server']
+    assets = await ChainCache().lookup_assets(client, [t['symbol_or_id'] for t in transfers])
+    if server.withdrawals is not None:
+        results = await server.withdrawals.submit_many([(t.get('idempotency_key'), t['to'],
+            asset, t['amount'], t.get('memo', '')) for t, asset in zip(transfers, assets)])
+        return [{'to': t['to'], 'error': str(r)} if isinstance(r, Exception) else r
+            for t, r in zip(transfers, results)]
+
+    account = await server.account_info(client)
+    items = []
+    for t, asset in zip(transfers, assets):
+        items.append({
+            'to': t['to'],
+            'asset': asset,
+            'amount': t['amount'],
+            'memo': t.get('memo', ''),
+        })
+    transfer = Transfer(client, account)
+    return await transfer.batch_send(items)
+
+@methods.add
+@instrument
+async def get_transfers(since_op=None, limit=100, account=None, since_account=None, context=None):
+    ''' 按操作顺序获取已处理转账(本地索引)
+        :param since_op 起始操作ID, 为空时从头开始
+        :param limit 最大数量
+        :param account 监控账户名, 为空时不限
+        :param since_account 上一页最后一条的监控账户, 与since_op组成分页位置(不包含)
+    '''
+    seq = get_operation_id(since_op) if since_op else 0
+    return context['server'].transfers.since(seq, limit, account, since_account)
+
+@methods.add
+@instrument
+async def get_transfer_by_txid(txid, context):
+    ''' 获取交易包含的已处理转账(本地索引)
+    '''
+    return context['server'].transfers.by_txid(txid)
+
+@methods.add
+@instrument
+async def get_deposits_by_memo(memo, account=None, context=None):
+    ''' 按备注获取充值(本地索引)
+        :param account 监控账户名, 为空时不限
+    '''
+    return context['server'].transfers.deposits_by_memo(memo, account)
+
+@methods.add
+@instrument
 async def get_transfer_fees(symbols_or_ids : list, context):
     ''' 获取转账手续费
     '''
-    assets = []
     client = context['client']
     server = context['server']
-    for asset in symbols_or_ids:
-        assets.append(await server.get_asset_info(client, asset))
+    assets = await ChainCache().lookup_assets(client, symbols_or_ids)
     return await server.calcul_transfer_fees(client, assets)
 
+@methods.add
+@instrument
+async def pool_statistics(context):
+    ''' 连接池统计
+    '''
+    return context['server'].pool.statistics()
+
+@methods.add
+@instrument
+async def pusher_statistics(context):
+    ''' 推送统计
+    '''
+    monitor = context['server'].monitor
+    if monitor is None:
+        raise RuntimeError('Monitor is not running in this process')
+    return monitor.pusher.statistics()
+
+@methods.add
+@instrument
+async def monitor_statistics(context):
+    ''' 监控统计
+    '''
+    monitor = context['server'].monitor
+    if monitor is None:
+        raise RuntimeError('Monitor is not running in this process')
+    return monitor.statistics()
+
+@methods.add
+@instrument
+async def withdrawal_statistics(context):
+    ''' 提现统计
+    '''
+    withdrawals = context['server'].withdrawals
+    if withdrawals is None:
+        raise RuntimeError('Withdrawal engine is not running in this process')
+    return withdrawals.statistics()
+
+@methods.add
+@instrument
+async def crypto_statistics(context):
+    ''' 加密计算统计
+    '''
+    return CryptoExecutor().statistics()
+
+@methods.add
+@instrument
+async def rpc_statistics(context):
+    ''' 节点请求延迟统计
+    '''
+    return latency_statistics()
+
+@methods.add
+@instrument
+async def serializer_statistics(context):
+    ''' JSON序列化统计
+    '''
+    return Serializer().statistics()
+
+@methods.add
+@instrument
+async def cache_statistics(context):
+    ''' 缓存统计
+    '''
+    stats = ChainCache().statistics()
+    stats.update(TransactionResolver().statistics())
+    stats['chain_params'] = ChainParams().statistics()
+    stats['balances'] = context['server'].balances.statistics()
+    return stats
+
+async def metrics(request):
+    ''' 导出监控指标
+    '''
+    return web.Response(body=Registry().expose().encode('utf8'),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+def listen_metrics(host, port, loop=None):
+    ''' 单独监听监控指标接口(多进程模式下的核心进程不提供RPC服务)
+    '''
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    app = web.Application(loop=loop)
+    app.router.add_get('/metrics', metrics)
+    loop.run_until_complete(loop.create_server(app.make_handler(), host, port))
+
 class RpcServer(object):
     ''' json-rpc服务
     '''
-    asset_info = {}
 
-    def __init__(self, loop=None):
+    def __init__(self, pool, monitor=None, withdrawals=None, loop=None):
         self._loop = loop
+        self.pool = pool
+        self.monitor = monitor
+        self.withdrawals = withdrawals
+        self.balances = BalanceBook(monitor)
+        self.transfers = TransferIndex(SysConfig().transfer_index_path)
         if self._loop is None:
             self._loop = asyncio.get_event_loop()
         self._started = False
-        self._account_info = None
+        ChainParams().start(self.pool, self._loop)
 
-    def listen(self, host, port):
+    def listen(self, host, port, reuse_port=False):
         ''' 监听服务
+            :param reuse_port 多个进程共享监听端口(SO_REUSEPORT)
         '''
         if not self._started:
             app = web.Application(loop=self._loop)
             app.router.add_post('/', self._handle)
+            app.router.add_get('/metrics', metrics)
             self._loop.run_until_complete(
-                self._loop.create_server(app.make_handler(), host, port))
+                self._loop.create_server(app.make_handler(), host, port, reuse_port=reuse_port))
             self._started = True
 
     async def account_info(self, client):
-        if self._account_info is None:
-            self._account_info = await client.get_account_by_name(SysConfig().account)
-        return self._account_info
+        ''' 获取账户信息
+        '''
+        return await ChainCache().get_account_by_name(client, SysConfig().account)
 
     async def get_asset_info(self, client, symbol_or_id):
         ''' 获取资产信息
         '''
-        if symbol_or_id not in self.asset_info:
-            asset = (await client.lookup_asset_symbols([symbol_or_id]))[0]
-            self.asset_info[asset['id']] = asset
-            self.asset_info[asset['symbol']] = asset
-        return self.asset_info[symbol_or_id]
+        return await ChainCache().lookup_asset(client, symbol_or_id)
 
 
     async def get_transfer_fee(self, client):
         ''' 获取转账费用
         '''
-        obj = (await client.get_objects(['2.0.0']))[0]
+        obj = await ChainParams().get_global_properties(client)
         fees = obj['parameters']['current_fees']['parameters']
         scale = float(obj['parameters']['current_fees']['scale'])
         for f in fees:
@@ -119,11 +301,12 @@ class RpcServer(object):
         ''' 分发请求
         '''
         request = await request.text()
-        client = AsyncRPC(SysConfig().access, self._loop)
-        if not await client.wait_for_ready():
-            raise RuntimeError('Websocket connection failed')
+        try:
+            client = await self.pool.get_client()
+        except RPCError as e:
+            return web.json_response({'jsonrpc': '2.0', 'id': None,
+                'error': {'code': -32000, 'message': str(e)}}, status=503)
         response = await methods.dispatch(request, context={'server': self, 'client': client})
-        await client.close()
         if response.is_notification:
             return web.Response()
         else:
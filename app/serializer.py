@@ -0,0 +1,89 @@
+# -*- coding:utf-8 -*-
+
+import json
+import time
+from .singleton import Singleton
+from .sysconfig import SysConfig
+
+def _load_backend(name):
+    ''' 加载JSON后端, 返回(名称, loads, dumps)
+        dumps返回bytes
+    '''
+    if name in ('auto', 'orjson'):
+        try:
+            import orjson
+            return 'orjson', orjson.loads, orjson.dumps
+        except ImportError:
+            if name == 'orjson':
+                raise
+    if name in ('auto', 'ujson'):
+        try:
+            import ujson
+            return 'ujson', ujson.loads, lambda obj: ujson.dumps(obj).encode('utf8')
+        except ImportError:
+            if name == 'ujson':
+                raise
+    return 'json', json.loads, lambda obj: json.dumps(obj).encode('utf8')
+
+@Singleton
+class Serializer(object):
+    ''' JSON序列化器
+        优先使用已安装的高性能后端(orjson/ujson), 否则使用标准库
+    '''
+
+    def __init__(self):
+        self.backend, self._loads, self._dumps = _load_backend(SysConfig().json_backend)
+        self._stats = {
+            'loads': 0,
+            'loads_bytes': 0,
+            'loads_time': 0.0,
+            'dumps': 0,
+            'dumps_bytes': 0,
+            'dumps_time': 0.0,
+            'fallbacks': 0,
+        }
+
+    def loads(self, payload):
+        ''' 解析JSON, 后端不支持的内容(如超大整数)回退到标准库
+        '''
+        start = time.monotonic()
+        try:
+            return self._loads(payload)
+        except ValueError:
+            self._stats['fallbacks'] += 1
+            return json.loads(payload)
+        finally:
+            self._stats['loads'] += 1
+            self._stats['loads_bytes'] += len(payload)
+            self._stats['loads_time'] += time.monotonic() - start
+
+    def dumps(self, obj):
+        ''' 序列化为JSON(bytes)
+        '''
+        start = time.monotonic()
+        try:
+            data = self._dumps(obj)
+        except (TypeError, OverflowError):
+            self._stats['fallbacks'] += 1
+            data = json.dumps(obj).encode('utf8')
+        self._stats['dumps'] += 1
+        self._stats['dumps_bytes'] += len(data)
+        self._stats['dumps_time'] += time.monotonic() - start
+        return data
+
+    def statistics(self):
+        ''' 序列化统计
+        '''
+        stats = dict(self._stats)
+        stats['backend'] = self.backend
+        return stats
+
+def compact_block(block, trx_indexes):
+    ''' 精简区块, 只保留时间戳和指定位置的交易
+        在整个区块解析完成后执行, 只减少缓存占用的内存, 不减少解析时间
+    '''
+    transactions = block['transactions']
+    return {
+        'timestamp': block['timestamp'],
+        'transactions': dict([(i, transactions[i]) for i in trx_indexes]),
+    }
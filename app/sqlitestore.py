@@ -0,0 +1,46 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+class SQLiteStore(object):
+    ''' SQLite存储基类
+        _conn在事件循环线程中使用(查询和少量更新); 热路径上的写入通过_write在专用写线程中执行,
+        写线程使用独立连接, 单线程保证写入顺序, 同步写盘不阻塞事件循环
+        :param path 数据库路径
+    '''
+
+    def __init__(self, path):
+        self._conn = self._connect(path)
+        self._writer = self._connect(path, check_same_thread=False)
+        self._executor = ThreadPoolExecutor(1)
+
+    def _connect(self, path, check_same_thread=True):
+        ''' 打开连接(WAL模式, 同步写盘)
+        '''
+        conn = sqlite3.connect(path, isolation_level=None, check_same_thread=check_same_thread)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=FULL')
+        return conn
+
+    async def _write(self, func, *args):
+        ''' 在写线程中以单个事务执行func(conn, *args)
+        '''
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self._transaction, func, args)
+
+    def _transaction(self, func, args):
+        self._writer.execute('BEGIN')
+        try:
+            result = func(self._writer, *args)
+            self._writer.execute('COMMIT')
+            return result
+        except Exception:
+            self._writer.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._writer.close()
+        self._conn.close()
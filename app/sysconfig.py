@@ -15,31 +15,96 @@ class SysConfig(object):
         data = yaml.load(open(CONFIG_FILE_PATH, 'rb'))
         # 接入点
         self.access     = data['access']
+        if isinstance(self.access, list):
+            self.accesses = self.access
+            self.access = self.accesses[0]
+        else:
+            self.accesses = [self.access]
         # 账户名
         self.account    = data['account']
         # 活动key
         self.active_key = data['active_key']
         # 备注key
         self.memo_key   = data['memo_key']
+        # 监控账户列表, 未配置时仅监控转账账户
+        self.accounts   = []
+        for item in data.get('accounts') or [{'name': self.account, 'lastop': 'lastop.yml'}]:
+            self.accounts.append({
+                'name': item['name'],
+                'memo_key': item.get('memo_key', self.memo_key),
+                'lastop': item.get('lastop', 'lastop-{0}.yml'.format(item['name'])),
+            })
         # 绑定地址
         self.rpc_host   = data['rpc_host']
         # 绑定端口
         self.rpc_port   = data['rpc_port']
+        # RPC工作进程数量, 0为单进程模式
+        self.rpc_workers = data.get('rpc_workers', 0)
+        # 多进程模式下核心进程的监控指标端口(/metrics)
+        self.metrics_port = data.get('metrics_port', self.rpc_port + 1)
+        # 监控模式: subscribe(订阅推送) 或 poll(定时轮询)
+        self.monitor_mode = data.get('monitor_mode', 'subscribe')
+        # 加密计算执行方式: process(进程池), thread(线程池), inline(事件循环内)
+        self.crypto_executor = data.get('crypto_executor', 'process')
+        # 加密计算工作数量, 0为CPU核数
+        self.crypto_workers = data.get('crypto_workers', 0)
+        # 备注共享密钥缓存数量(每个工作进程)
+        self.memo_cache_size = data.get('memo_cache_size', 1024)
         # 工人数量
         self.workernum  = data['workernum']
         # 回调地址
         self.webhook    = data['webhook']
-
-    def get_last_op_number(self):
-        ''' 获取最后操作数量
-        '''
-        data = yaml.load(open('lastop.yml', 'rb'))
-        return data['op_number']
-
-    def update_last_op_number(self, op_number):
-        ''' 更新最后操作数量
-        '''
-        data = {'op_number': op_number}
-        handle = open('lastop.yml', 'w')
-        yaml.dump(data, handle)
-        handle.close()
+        # 推送队列长度
+        self.queue_size = data.get('queue_size', 1000)
+        # 批量推送数量(大于1时以数组格式推送)
+        self.batch_size = data.get('batch_size', 1)
+        # 批量推送等待时间(毫秒)
+        self.batch_interval = data.get('batch_interval', 100)
+        # 发件箱路径
+        self.outbox_path = data.get('outbox_path', 'outbox.db')
+        # 已送达通知保留时间(秒)
+        self.outbox_retention = data.get('outbox_retention', 7*24*3600)
+        # 转账索引数据库路径
+        self.transfer_index_path = data.get('transfer_index_path', 'transfers.db')
+        # 是否等待不可逆确认: 开启后每笔转账先推送pending事件, 进入不可逆区块后推送confirmed事件
+        self.confirm_irreversible = data.get('confirm_irreversible', False)
+        # 推送重试初始间隔(秒)
+        self.retry_interval = data.get('retry_interval', 1)
+        # 推送重试最大间隔(秒)
+        self.retry_max_interval = data.get('retry_max_interval', 300)
+        # 连接池大小
+        self.pool_size  = data.get('pool_size', 4)
+        # JSON后端: auto, orjson, ujson, json
+        self.json_backend = data.get('json_backend', 'auto')
+        # 交易定位方式: transaction(按区块和位置获取单个交易), block(下载整个区块)
+        self.tx_lookup = data.get('tx_lookup', 'transaction')
+        # 区块缓存只保留时间戳和所需交易(只节省内存, 区块仍完整解析)
+        self.block_compact = data.get('block_compact', True)
+        # 节点请求超时(秒)
+        self.rpc_timeout = data.get('rpc_timeout', 30)
+        # 单个连接最大并发请求数量
+        self.rpc_max_inflight = data.get('rpc_max_inflight', 256)
+        # 提现任务数据库路径
+        self.withdraw_path = data.get('withdraw_path', 'withdrawals.db')
+        # 单次签名最多打包的提现数量
+        self.withdraw_batch_size = data.get('withdraw_batch_size', 50)
+        # 提现打包等待时间(毫秒)
+        self.withdraw_batch_interval = data.get('withdraw_batch_interval', 200)
+        # 提现交易过期时间(秒), 过期仍未进入不可逆区块的提现判定为失败
+        self.withdraw_expiration = data.get('withdraw_expiration', 60)
+        # 提现确认检查间隔(秒)
+        self.withdraw_watch_interval = data.get('withdraw_watch_interval', 3)
+        # 每次检查最多扫描的区块数量
+        self.withdraw_scan_blocks = data.get('withdraw_scan_blocks', 100)
+        # 签名进程轮询任务库间隔(秒), 用于处理RPC工作进程写入的任务
+        self.withdraw_poll_interval = data.get('withdraw_poll_interval', 1)
+        # 链参数(引用区块和手续费表)刷新间隔(秒)
+        self.chain_params_interval = data.get('chain_params_interval', 3)
+        # 缓存容量
+        self.cache_size = data.get('cache_size', 10000)
+        # 缓存过期时间(秒)
+        self.cache_ttl  = data.get('cache_ttl', 600)
+        # 检查点写入间隔(秒)
+        self.checkpoint_interval = data.get('checkpoint_interval', 1)
+        # 检查点写入后同步磁盘
+        self.checkpoint_fsync = data.get('checkpoint_fsync', False)
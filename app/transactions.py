@@ -17,6 +17,12 @@ async def add_required_fees(client, ops, asset_id='1.3.0'):
     ''' 添加必要手续费
     '''
     fees = await client.get_required_fees([i.json() for i in ops], asset_id)
+    return set_required_fees(ops, fees)
+
+def set_required_fees(ops, fees):
+    ''' 设置手续费
+        :param fees get_required_fees返回结果
+    '''
     for i, d in enumerate(ops):
         if isinstance(fees[i], list):
             ops[i].op.data['fee'] = Asset(
@@ -1,16 +1,41 @@
 # -*- coding:utf-8 -*-
 
 import random
+import asyncio
+from decimal import Decimal, InvalidOperation
+from .cache import ChainCache
+from .chainparams import ChainParams, is_insufficient_fee
 from .sysconfig import SysConfig
 from .builder import Builder, MissingKeyError
 from bitsharesbase import operations
 from bitsharesbase import memo as BtsMemo
 from bitsharesbase.account import PrivateKey, PublicKey
 
+def to_integer_amount(amount, precision):
+    ''' 按资产精度换算为链上整数数量, 精度不足时报错而不截断
+        :param amount 数量(字符串或数字)
+        :param precision 资产精度
+    '''
+    try:
+        value = Decimal(str(amount)).scaleb(int(precision))
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise ValueError('Invalid amount {0}'.format(amount))
+    if value != value.to_integral_value():
+        raise ValueError('Amount {0} exceeds asset precision {1}'.format(amount, precision))
+    return int(value)
+
 class Transfer(object):
     ''' 转账模块
         :param client RPC客户端
     '''
+    # 交易头和签名预留字节
+    TRANSACTION_OVERHEAD = 256
+    # 操作编号和手续费预留字节
+    OPERATION_OVERHEAD = 16
+    # 单笔交易最大操作数量
+    MAX_OPERATIONS = 200
 
     def __init__(self, client, account):
         self.client = client
@@ -19,21 +44,97 @@ class Transfer(object):
     async def send_to(self, to, asset, amount, memo=''):
         ''' 发送资产
         '''
+        op = await self._make_operation(to, asset, amount, memo)
+        signedtx = await self._sign_and_broadcast([op], asset['id'])
+        return signedtx.id
+
+    async def batch_send(self, transfers):
+        ''' 批量发送资产
+            同一资产的转账打包到尽量少的交易中, 每笔交易只计算一次手续费和签名
+            :param transfers 转账列表, 每项为 {'to', 'asset', 'amount', 'memo'}
+            :return 与转账列表顺序一致的结果, 每项为 {'to', 'txid'} 或 {'to', 'error'}
+        '''
+        results = [{'to': t['to']} for t in transfers]
+        rejected = await self._build_and_broadcast(transfers, list(range(len(transfers))), results)
+        if len(rejected) > 0:
+            # 手续费不足时改用节点计算的手续费重新签名一次
+            await self._build_and_broadcast(transfers, rejected, results)
+        return results
+
+    async def _build_and_broadcast(self, transfers, positions, results):
+        ''' 签名并广播转账列表中指定位置的转账, 结果写入results
+            :return 因手续费不足被拒绝的位置列表
+        '''
+        rejected = []
+        errors, transactions = await self.build_transactions([transfers[i] for i in positions])
+        for i, error in errors.items():
+            results[positions[i]]['error'] = error
+        for indexes, txbuffer, txid in transactions:
+            indexes = [positions[i] for i in indexes]
+            try:
+                await txbuffer.broadcast()
+                for i in indexes:
+                    results[i].pop('error', None)
+                    results[i]['txid'] = txid
+            except Exception as e:
+                for i in indexes:
+                    results[i]['error'] = str(e)
+                if is_insufficient_fee(e):
+                    ChainParams().fee_rejected(transfers[indexes[0]]['asset']['id'])
+                    rejected.extend(indexes)
+        return rejected
+
+    async def build_transactions(self, transfers, expiration=600):
+        ''' 生成并签名批量转账交易, 不广播
+            :param transfers 转账列表, 每项为 {'to', 'asset', 'amount', 'memo'}
+            :return (错误信息 {位置: 错误}, 交易列表 [(位置列表, Builder, txid)])
+        '''
+        # 并发加密备注和查询账户
+        ops = await asyncio.gather(*[self._make_operation(
+            t['to'], t['asset'], t['amount'], t.get('memo', '')) for t in transfers],
+            return_exceptions=True)
+        errors = {}
+        for i, op in enumerate(ops):
+            if isinstance(op, Exception):
+                errors[i] = str(op)
+
+        # 按资产分组并按交易大小拆分
+        groups = {}
+        for i, t in enumerate(transfers):
+            if i not in errors:
+                groups.setdefault(t['asset']['id'], []).append(i)
+        transactions = []
+        if len(groups) == 0:
+            return errors, transactions
+        max_size = await self._get_max_transaction_size()
+        for asset_id, indexes in groups.items():
+            for chunk in self._split_by_size([(i, ops[i]) for i in indexes], max_size):
+                try:
+                    txbuffer, signedtx = await self._sign([op for _, op in chunk], asset_id, expiration)
+                    transactions.append(([i for i, _ in chunk], txbuffer, signedtx.id))
+                except Exception as e:
+                    for i, _ in chunk:
+                        errors[i] = str(e)
+        return errors, transactions
+
+    async def _make_operation(self, to, asset, amount, memo=''):
+        ''' 生成转账操作
+        '''
         # 加密备注
         to_id = None
         memo_data = None
         if memo != '':
             to_id, memo_data = await self._encrypt_memo(to, memo)
         else:
-            to_account = await self.client.get_account_by_name(to)
+            to_account = await ChainCache().get_account_by_name(self.client, to)
             to_id = to_account['id']
 
         # 计算转账数量
-        amount = amount * 10 ** asset['precision']
+        amount = to_integer_amount(amount, asset['precision'])
 
         # 生成转账操作
         prefix = self.client.chain_params['prefix']
-        op = operations.Transfer(**{
+        return operations.Transfer(**{
             'to': to_id,
             'from': self.account['id'],
             'amount': {
@@ -45,13 +146,54 @@ class Transfer(object):
             'fee': {'amount': 0, 'asset_id': asset['id']}
         })
 
-        # 执行转账操作
+    async def _sign(self, ops, fee_asset_id, expiration=600):
+        ''' 签名交易
+        '''
+        prefix = self.client.chain_params['prefix']
         txbuffer = Builder(self.client)
-        txbuffer.append_ops(op)
+        txbuffer.append_ops(ops)
         await txbuffer.append_signer(self.account, SysConfig().active_key, prefix, 'active')
-        signedtx = await txbuffer.sign(asset['id'], expiration=600)
-        await txbuffer.broadcast()
-        return signedtx.id
+        signedtx = await txbuffer.sign(fee_asset_id, expiration=expiration)
+        return txbuffer, signedtx
+
+    async def _sign_and_broadcast(self, ops, fee_asset_id):
+        ''' 签名并广播交易
+            手续费不足被拒绝时改用节点计算的手续费重新签名广播一次
+        '''
+        txbuffer, signedtx = await self._sign(ops, fee_asset_id)
+        try:
+            await txbuffer.broadcast()
+        except Exception as e:
+            if not is_insufficient_fee(e):
+                raise e
+            ChainParams().fee_rejected(fee_asset_id)
+            txbuffer, signedtx = await self._sign(ops, fee_asset_id)
+            await txbuffer.broadcast()
+        return signedtx
+
+    async def _get_max_transaction_size(self):
+        ''' 获取交易大小上限
+        '''
+        obj = await ChainParams().get_global_properties(self.client)
+        return obj['parameters']['maximum_transaction_size']
+
+    def _split_by_size(self, ops, max_size):
+        ''' 按交易大小拆分操作
+        '''
+        chunks = []
+        chunk = []
+        size = self.TRANSACTION_OVERHEAD
+        for item in ops:
+            op_size = len(bytes(item[1])) + self.OPERATION_OVERHEAD
+            if len(chunk) > 0 and (size + op_size > max_size or len(chunk) >= self.MAX_OPERATIONS):
+                chunks.append(chunk)
+                chunk = []
+                size = self.TRANSACTION_OVERHEAD
+            chunk.append(item)
+            size += op_size
+        if len(chunk) > 0:
+            chunks.append(chunk)
+        return chunks
 
     async def _encrypt_memo(self, to, memo):
         ''' 加密备注信息
@@ -66,7 +208,7 @@ class Transfer(object):
 
         # 加密备注信息
         prefix = self.client.chain_params['prefix']
-        to_account = await self.client.get_account_by_name(to)
+        to_account = await ChainCache().get_account_by_name(self.client, to)
         enc = BtsMemo.encode_memo(
             PrivateKey(SysConfig().memo_key, prefix=prefix),
             PublicKey(
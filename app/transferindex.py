@@ -0,0 +1,116 @@
+# -*- coding:utf-8 -*-
+
+import json
+from .sqlitestore import SQLiteStore
+
+# 转账确认状态
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+
+class TransferIndex(SQLiteStore):
+    ''' 已处理转账索引
+        监控器推送前写入每笔解码后的转账, 供对账查询, 无需再访问节点账户历史
+        :param path 数据库路径
+    '''
+    MAX_LIMIT = 1000
+
+    def __init__(self, path):
+        super(TransferIndex, self).__init__(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS transfers ('
+            'op_id TEXT NOT NULL, '
+            'account TEXT NOT NULL, '
+            'seq INTEGER NOT NULL, '
+            'block_num INTEGER NOT NULL, '
+            'txid TEXT, '
+            'asset_id TEXT NOT NULL, '
+            'amount TEXT NOT NULL, '
+            'sender TEXT NOT NULL, '
+            'recipient TEXT NOT NULL, '
+            'memo TEXT, '
+            'status TEXT, '
+            'payload TEXT NOT NULL, '
+            'PRIMARY KEY (op_id, account))')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS transfers_seq ON transfers (seq)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS transfers_account ON transfers (account, seq)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS transfers_txid ON transfers (txid)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS transfers_memo ON transfers (memo, recipient)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS transfers_status ON transfers (status, block_num)')
+
+    async def add(self, trxs):
+        ''' 写入一批转账(单个事务), 已存在的忽略
+        '''
+        rows = []
+        for trx in trxs:
+            rows.append((trx['op_id'], trx['account'], int(trx['op_id'].split('.')[2]),
+                trx['heigth'], trx['txid'], trx['asset_id'], trx['amount'], trx['from'],
+                trx['to'], trx['memo'], trx.get('status'), json.dumps(trx)))
+        if len(rows) == 0:
+            return
+        await self._write(lambda conn: conn.executemany(
+            'INSERT OR IGNORE INTO transfers (op_id, account, seq, block_num, txid, '
+            'asset_id, amount, sender, recipient, memo, status, payload) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows))
+
+    def pending(self, block_num, limit):
+        ''' 获取区块高度不超过block_num的待确认转账
+        '''
+        return self._fetchall(
+            'SELECT payload FROM transfers WHERE status = ? AND block_num <= ? '
+            'ORDER BY block_num, seq LIMIT ?', (PENDING, block_num, limit))
+
+    async def set_status(self, trxs):
+        ''' 更新转账确认状态(单个事务)
+        '''
+        rows = [(trx['status'], json.dumps(trx), trx['op_id'], trx['account']) for trx in trxs]
+        await self._write(lambda conn: conn.executemany(
+            'UPDATE transfers SET status = ?, payload = ? WHERE op_id = ? AND account = ?', rows))
+
+    def since(self, seq, limit, account=None, since_account=None):
+        ''' 按(操作序号, 监控账户)顺序获取指定位置之后的转账
+            同一操作可能对应多个监控账户, 分页时需要同时传入上一页最后一条的账户
+            :param seq 操作序号
+            :param limit 最大数量
+            :param account 监控账户名, 为空时不限
+            :param since_account 与seq组成分页位置(不包含), 为空时跳过该操作的所有记录
+        '''
+        limit = max(1, min(int(limit), self.MAX_LIMIT))
+        if account is None:
+            if since_account is None:
+                return self._fetchall(
+                    'SELECT payload FROM transfers WHERE seq > ? ORDER BY seq, account LIMIT ?',
+                    (seq, limit))
+            return self._fetchall(
+                'SELECT payload FROM transfers WHERE seq > ? OR (seq = ? AND account > ?) '
+                'ORDER BY seq, account LIMIT ?', (seq, seq, since_account, limit))
+        return self._fetchall(
+            'SELECT payload FROM transfers WHERE seq > ? AND account = ? ORDER BY seq LIMIT ?',
+            (seq, account, limit))
+
+    def by_txid(self, txid):
+        ''' 获取交易包含的转账
+        '''
+        return self._fetchall(
+            'SELECT payload FROM transfers WHERE txid = ? ORDER BY seq, account', (txid,))
+
+    def deposits_by_memo(self, memo, account=None):
+        ''' 按备注获取充值(收款方为监控账户的转账)
+            :param account 监控账户名, 为空时不限
+        '''
+        if account is None:
+            return self._fetchall(
+                'SELECT payload FROM transfers WHERE memo = ? AND recipient = account '
+                'ORDER BY seq', (memo,))
+        return self._fetchall(
+            'SELECT payload FROM transfers WHERE memo = ? AND recipient = ? AND account = ? '
+            'ORDER BY seq', (memo, account, account))
+
+    def _fetchall(self, sql, params):
+        cursor = self._conn.execute(sql, params)
+        return [json.loads(payload) for (payload,) in cursor.fetchall()]
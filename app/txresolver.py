@@ -0,0 +1,87 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+from .cache import LRUCache
+from .singleton import Singleton
+from .sysconfig import SysConfig
+
+@Singleton
+class TransactionResolver(object):
+    ''' 交易定位器
+        通过get_block_header和get_transaction获取时间戳和交易, 不下载整个区块
+    '''
+
+    def __init__(self):
+        maxsize = max(1, SysConfig().cache_size // 10)
+        self._headers = LRUCache(maxsize)
+        self._transactions = LRUCache(maxsize)
+
+    def statistics(self):
+        ''' 缓存统计
+        '''
+        return {
+            'headers': self._headers.statistics(),
+            'transactions': self._transactions.statistics(),
+        }
+
+    async def resolve(self, client, trx_indexes):
+        ''' 批量获取交易, 同一区块和交易只请求一次
+            :param trx_indexes 各区块需要的交易位置
+            :return 与精简区块结构相同: {区块号: {'timestamp', 'transactions': {位置: 交易}}}
+        '''
+        block_nums = list(trx_indexes.keys())
+        positions = sorted(set([(n, i) for n in block_nums for i in trx_indexes[n]]))
+        headers, transactions = await asyncio.gather(
+            asyncio.gather(*[self._get_header(client, n) for n in block_nums]),
+            asyncio.gather(*[self._get_transaction(client, n, i) for n, i in positions]))
+
+        result = {}
+        for block_num, header in zip(block_nums, headers):
+            result[block_num] = {'timestamp': header['timestamp'], 'transactions': {}}
+        for (block_num, trx_in_block), transaction in zip(positions, transactions):
+            result[block_num]['transactions'][trx_in_block] = transaction
+        return result
+
+    async def refresh(self, client, positions):
+        ''' 从节点重新获取交易(忽略缓存并更新), 用于不可逆确认
+            :param positions 交易位置列表[(区块号, 位置)]
+            :return 与参数顺序一致的交易列表, 区块内不存在该位置(分叉后交易变少)时为None
+        '''
+        transactions = await asyncio.gather(
+            *[client.get_transaction(n, i) for n, i in positions], return_exceptions=True)
+        blocks = {}
+        result = []
+        for (block_num, trx_in_block), transaction in zip(positions, transactions):
+            if isinstance(transaction, Exception):
+                # 位置不存在时节点返回错误, 通过区块判断; 获取区块失败时抛出异常
+                if block_num not in blocks:
+                    blocks[block_num] = await client.get_block(block_num)
+                block = blocks[block_num]
+                if block is None:
+                    raise transaction
+                transaction = None
+                if trx_in_block < len(block['transactions']):
+                    transaction = block['transactions'][trx_in_block]
+            if transaction is not None:
+                self._transactions.set((block_num, trx_in_block), transaction)
+            result.append(transaction)
+        return result
+
+    async def _get_header(self, client, block_num):
+        ''' 获取区块头
+        '''
+        header = self._headers.get(block_num)
+        if header is None:
+            header = await client.get_block_header(block_num)
+            self._headers.set(block_num, {'timestamp': header['timestamp']})
+        return header
+
+    async def _get_transaction(self, client, block_num, trx_in_block):
+        ''' 获取区块内交易
+        '''
+        key = (block_num, trx_in_block)
+        transaction = self._transactions.get(key)
+        if transaction is None:
+            transaction = await client.get_transaction(block_num, trx_in_block)
+            self._transactions.set(key, transaction)
+        return transaction
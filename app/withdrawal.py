@@ -0,0 +1,433 @@
+# -*- coding:utf-8 -*-
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+from .cache import ChainCache
+from .transfer import Transfer, to_integer_amount
+from .sysconfig import SysConfig
+from .chainparams import ChainParams, is_insufficient_fee
+from .sqlitestore import SQLiteStore
+
+# 提现状态: 排队, 已签名(已落盘未确认广播), 已广播, 已进入区块, 已不可逆, 失败
+QUEUED = 'queued'
+SIGNED = 'signed'
+BROADCAST = 'broadcast'
+INCLUDED = 'included'
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+
+class WithdrawalStore(SQLiteStore):
+    ''' 提现任务存储
+        :param path 数据库路径
+    '''
+    COLUMNS = ('job_id', 'key', 'recipient', 'asset_id', 'amount', 'memo', 'status',
+        'txid', 'tx', 'start_block', 'scanned', 'expiration', 'block_num', 'error',
+        'created', 'updated')
+
+    def __init__(self, path):
+        super(WithdrawalStore, self).__init__(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS withdrawals ('
+            'job_id TEXT PRIMARY KEY, '
+            'key TEXT NOT NULL UNIQUE, '
+            'recipient TEXT NOT NULL, '
+            'asset_id TEXT NOT NULL, '
+            'amount TEXT NOT NULL, '
+            'memo TEXT NOT NULL, '
+            'status TEXT NOT NULL, '
+            'txid TEXT, '
+            'tx TEXT, '
+            'start_block INTEGER, '
+            'scanned INTEGER, '
+            'expiration TEXT, '
+            'block_num INTEGER, '
+            'error TEXT, '
+            'created REAL NOT NULL, '
+            'updated REAL NOT NULL)')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS withdrawals_status ON withdrawals (status, created)')
+
+    async def add_many(self, jobs):
+        ''' 批量写入提现任务(单个事务), 幂等键已存在时返回已有任务
+            :param jobs [(job_id, key, recipient, asset_id, amount, memo)]
+            :return 与参数顺序一致的[(任务, 是否新建)]
+        '''
+        now = time.time()
+        rows = [job + (QUEUED, now, now) for job in jobs]
+        return await self._write(self._add_many, rows)
+
+    def _add_many(self, conn, rows):
+        result = []
+        for row in rows:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO withdrawals (job_id, key, recipient, asset_id, amount, '
+                'memo, status, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+            job = conn.execute('SELECT * FROM withdrawals WHERE key = ?', (row[1],)).fetchone()
+            result.append((self._make_job(job), cursor.rowcount == 1))
+        return result
+
+    def get(self, job_id):
+        ''' 按任务ID获取
+        '''
+        return self._fetchone('SELECT * FROM withdrawals WHERE job_id = ?', (job_id,))
+
+    def get_by_key(self, key):
+        ''' 按幂等键获取
+        '''
+        return self._fetchone('SELECT * FROM withdrawals WHERE key = ?', (key,))
+
+    def by_status(self, statuses):
+        ''' 按状态获取
+        '''
+        cursor = self._conn.execute(
+            'SELECT * FROM withdrawals WHERE status IN ({0}) ORDER BY created'.format(
+                ','.join(['?'] * len(statuses))), statuses)
+        return [self._make_job(row) for row in cursor.fetchall()]
+
+    def update(self, job_ids, **fields):
+        ''' 更新任务字段
+        '''
+        fields['updated'] = time.time()
+        names = sorted(fields.keys())
+        assert all([name in self.COLUMNS for name in names]), 'Invalid column'
+        self._conn.execute(
+            'UPDATE withdrawals SET {0} WHERE job_id IN ({1})'.format(
+                ', '.join(['{0} = ?'.format(name) for name in names]),
+                ','.join(['?'] * len(job_ids))),
+            [fields[name] for name in names] + list(job_ids))
+
+    def statistics(self):
+        ''' 任务统计
+        '''
+        cursor = self._conn.execute('SELECT status, COUNT(*) FROM withdrawals GROUP BY status')
+        return dict(cursor.fetchall())
+
+    def _fetchone(self, sql, params):
+        row = self._conn.execute(sql, params).fetchone()
+        return self._make_job(row) if row is not None else None
+
+    def _make_job(self, row):
+        return dict(zip(self.COLUMNS, row))
+
+def make_job_info(job):
+    ''' 任务信息(对外)
+    '''
+    return {
+        'job_id': job['job_id'],
+        'key': job['key'],
+        'to': job['recipient'],
+        'asset_id': job['asset_id'],
+        'amount': job['amount'],
+        'memo': job['memo'],
+        'status': job['status'],
+        'txid': job['txid'],
+        'block_num': job['block_num'],
+        'error': job['error'],
+        'created': job['created'],
+        'updated': job['updated'],
+    }
+
+class WithdrawalEngine(object):
+    ''' 异步提现引擎
+        任务落盘后立即返回, 后台批量签名; 签名交易先落盘再广播, 重试只广播同一交易,
+        保证每个任务最多上链一次。交易进入不可逆区块后确认, 过期仍未上链则失败。
+        多进程部署时只有一个进程作为签名者, 其它进程只写入任务, 由签名者轮询任务库处理。
+        :param pool RPC连接池
+        :param signer 是否负责签名和广播
+    '''
+
+    def __init__(self, pool, loop=None, signer=True):
+        self.pool = pool
+        self.signer = signer
+        self._loop = loop
+        self._store = WithdrawalStore(SysConfig().withdraw_path)
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        self._broadcasting = set()
+        self._stats = {
+            'submitted': 0,
+            'duplicated': 0,
+            'transactions': 0,
+            'broadcasts': 0,
+            'broadcast_errors': 0,
+            'resigned': 0,
+            'confirmed': 0,
+            'failed': 0,
+        }
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        if self.signer:
+            self._load_queued()
+            asyncio.ensure_future(self._do_sign(), loop=self._loop)
+            asyncio.ensure_future(self._do_watch(), loop=self._loop)
+            asyncio.ensure_future(self._do_poll(), loop=self._loop)
+
+    async def submit(self, key, to, asset, amount, memo=''):
+        ''' 提交提现任务, 相同幂等键只执行一次
+            :param key 幂等键, 为空时不去重
+            :return 任务信息
+        '''
+        [result] = await self.submit_many([(key, to, asset, amount, memo)])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def submit_many(self, requests):
+        ''' 批量提交提现任务(单个事务)
+            :param requests [(幂等键, 收款账户, 资产, 数量, 备注)]
+            :return 与参数顺序一致的任务信息, 数量超出资产精度或幂等键参数冲突时为ValueError
+        '''
+        jobs = []
+        results = [None] * len(requests)
+        for i, (key, to, asset, amount, memo) in enumerate(requests):
+            try:
+                to_integer_amount(amount, asset['precision'])
+            except ValueError as e:
+                results[i] = e
+                continue
+            job_id = uuid.uuid4().hex
+            jobs.append((job_id, key or job_id, to, asset['id'], str(amount), memo))
+        positions = [i for i, r in enumerate(results) if r is None]
+        for i, params, (job, created) in zip(positions, jobs, await self._store.add_many(jobs)):
+            if not created:
+                if (job['recipient'], job['asset_id'], job['amount'], job['memo']) != params[2:]:
+                    results[i] = ValueError(
+                        'Idempotency key {0} reused with different parameters'.format(params[1]))
+                    continue
+                self._stats['duplicated'] += 1
+            else:
+                self._stats['submitted'] += 1
+                if self.signer:
+                    self._enqueue(job['job_id'])
+            results[i] = make_job_info(job)
+        return results
+
+    def get(self, job_id):
+        ''' 获取任务信息
+        '''
+        job = self._store.get(job_id)
+        return make_job_info(job) if job is not None else None
+
+    def statistics(self):
+        ''' 提现统计
+        '''
+        stats = dict(self._stats)
+        stats['queue_size'] = self._queue.qsize()
+        stats['jobs'] = self._store.statistics()
+        return stats
+
+    def _enqueue(self, job_id):
+        ''' 加入签名队列
+        '''
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    def _load_queued(self):
+        ''' 从任务库加载排队任务(包括其它进程写入的任务)
+        '''
+        for job in self._store.by_status([QUEUED]):
+            self._enqueue(job['job_id'])
+
+    async def _do_poll(self):
+        ''' 轮询任务库
+        '''
+        while True:
+            await asyncio.sleep(SysConfig().withdraw_poll_interval)
+            try:
+                self._load_queued()
+            except Exception as e:
+                logging.warn('Failed to load queued withdrawals, %s', str(e))
+
+    async def _next_batch(self):
+        ''' 获取一批任务
+        '''
+        batch = [await self._queue.get()]
+        batch_size = SysConfig().withdraw_batch_size
+        deadline = time.monotonic() + SysConfig().withdraw_batch_interval / 1000.0
+        while len(batch) < batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _do_sign(self):
+        ''' 签名工作
+        '''
+        while True:
+            job_ids = await self._next_batch()
+            self._queued.difference_update(job_ids)
+            jobs = [self._store.get(job_id) for job_id in sorted(set(job_ids), key=job_ids.index)]
+            jobs = [job for job in jobs if job['status'] == QUEUED]
+            if len(jobs) == 0:
+                continue
+            try:
+                await self._sign_jobs(jobs)
+            except Exception as e:
+                logging.warn('Failed to sign withdrawals, %s', str(e))
+                await asyncio.sleep(SysConfig().retry_interval)
+                for job in jobs:
+                    if self._store.get(job['job_id'])['status'] == QUEUED:
+                        self._enqueue(job['job_id'])
+
+    async def _sign_jobs(self, jobs):
+        ''' 签名一批任务, 签名交易落盘后再广播
+        '''
+        client = await self.pool.get_client()
+        account = await ChainCache().get_account_by_name(client, SysConfig().account)
+        assets = await ChainCache().get_assets(client, list(set([job['asset_id'] for job in jobs])))
+        properties = await ChainParams().get_dynamic_properties(client)
+        transfers = [{
+            'to': job['recipient'],
+            'asset': assets[job['asset_id']],
+            'amount': job['amount'],
+            'memo': job['memo'],
+        } for job in jobs]
+
+        transfer = Transfer(client, account)
+        errors, transactions = await transfer.build_transactions(
+            transfers, SysConfig().withdraw_expiration)
+        for i, error in errors.items():
+            self._store.update([jobs[i]['job_id']], status=FAILED, error=error)
+            self._stats['failed'] += 1
+        for indexes, txbuffer, txid in transactions:
+            job_ids = [jobs[i]['job_id'] for i in indexes]
+            tx = txbuffer.json()
+            self._store.update(job_ids, status=SIGNED, txid=txid, tx=json.dumps(tx),
+                start_block=properties['head_block_number'], expiration=tx['expiration'])
+            self._stats['transactions'] += 1
+            await self._broadcast(client, job_ids, tx)
+
+    async def _broadcast(self, client, job_ids, tx):
+        ''' 广播已签名交易
+            广播失败时保持已签名状态, 交易过期前重试广播同一交易;
+            手续费不足被拒绝时同一交易不会再被接受, 过期后重新签名(见_watch)
+        '''
+        key = tuple(job_ids)
+        if key in self._broadcasting:
+            return
+        self._broadcasting.add(key)
+        try:
+            self._stats['broadcasts'] += 1
+            await client.broadcast_transaction(tx, api='network_broadcast')
+            self._store.update(job_ids, status=BROADCAST, error=None)
+        except Exception as e:
+            self._stats['broadcast_errors'] += 1
+            self._store.update(job_ids, error=str(e))
+            logging.warn('Failed to broadcast withdrawal transaction, %s', str(e))
+            if is_insufficient_fee(e):
+                ChainParams().fee_rejected(tx['operations'][0][1]['fee']['asset_id'])
+        finally:
+            self._broadcasting.discard(key)
+
+    def _resign(self, job_ids):
+        ''' 已过期的交易重新排队签名
+        '''
+        self._store.update(job_ids, status=QUEUED, txid=None, tx=None, start_block=None,
+            scanned=None, expiration=None)
+        self._stats['resigned'] += len(job_ids)
+        for job_id in job_ids:
+            self._enqueue(job_id)
+
+    async def _do_watch(self):
+        ''' 确认工作
+        '''
+        while True:
+            await asyncio.sleep(SysConfig().withdraw_watch_interval)
+            try:
+                await self._watch()
+            except Exception as e:
+                logging.warn('Failed to watch withdrawals, %s', str(e))
+
+    def _find_transactions(self, block, signatures):
+        ''' 按签名查找区块内的已签名交易
+            签名覆盖交易摘要, 签名相同即为同一交易; 不计算区块内其它交易的ID,
+            避免序列化库不支持的操作类型导致扫描失败
+            :param signatures {签名元组: txid}
+            :return 区块内包含的txid集合
+        '''
+        found = set()
+        for tx in block['transactions']:
+            txid = signatures.get(tuple(tx.get('signatures', [])))
+            if txid is not None:
+                found.add(txid)
+        return found
+
+    async def _watch(self):
+        ''' 跟踪交易状态
+            最近交易中查到时标记为已进入区块; 只扫描不可逆区块做最终判定,
+            交易出现在不可逆区块中即确认, 出现时间戳晚于过期时间的不可逆区块仍未找到即失败;
+            因手续费不足从未广播成功的交易此时已确定不会上链, 任务重新排队签名
+        '''
+        jobs = self._store.by_status([SIGNED, BROADCAST, INCLUDED])
+        if len(jobs) == 0:
+            return
+        client = await self.pool.get_client()
+        properties = await ChainParams().get_dynamic_properties(client)
+        head_time = properties['time']
+
+        # 按交易分组
+        txs = {}
+        for job in jobs:
+            txs.setdefault(job['txid'], []).append(job)
+
+        # 重新广播未过期的已签名交易
+        for txid, items in txs.items():
+            job = items[0]
+            if job['status'] == SIGNED and job['expiration'] > head_time:
+                await self._broadcast(client, [j['job_id'] for j in items], json.loads(job['tx']))
+
+        # 查询最近交易
+        recent = await asyncio.gather(*[client.get_recent_transaction_by_id(txid)
+            for txid, items in txs.items() if items[0]['status'] != INCLUDED],
+            return_exceptions=True)
+        for txid, trx in zip([t for t, items in txs.items() if items[0]['status'] != INCLUDED], recent):
+            if isinstance(trx, dict):
+                self._store.update([j['job_id'] for j in txs[txid]], status=INCLUDED)
+
+        # 扫描不可逆区块
+        start = min([job['scanned'] or job['start_block'] for job in jobs]) + 1
+        end = min(properties['last_irreversible_block_num'],
+            start + SysConfig().withdraw_scan_blocks - 1)
+        if end < start:
+            return
+        blocks = await asyncio.gather(*[client.get_block(n) for n in range(start, end + 1)])
+        pending = dict(txs)
+        signatures = dict([(tuple(json.loads(items[0]['tx'])['signatures']), txid)
+            for txid, items in txs.items()])
+        for block_num, block in zip(range(start, end + 1), blocks):
+            if len(pending) == 0:
+                break
+            transaction_ids = self._find_transactions(block, signatures)
+            for txid in list(pending.keys()):
+                items = pending[txid]
+                if block_num <= (items[0]['scanned'] or items[0]['start_block']):
+                    continue
+                job_ids = [j['job_id'] for j in items]
+                if txid in transaction_ids:
+                    self._store.update(job_ids, status=CONFIRMED, block_num=block_num,
+                        scanned=block_num, error=None)
+                    self._stats['confirmed'] += len(job_ids)
+                    del pending[txid]
+                elif block['timestamp'] > items[0]['expiration']:
+                    if items[0]['status'] == SIGNED and is_insufficient_fee(items[0]['error']):
+                        self._resign(job_ids)
+                    else:
+                        self._store.update(job_ids, status=FAILED, scanned=block_num,
+                            error='Transaction expired')
+                        self._stats['failed'] += len(job_ids)
+                    del pending[txid]
+        for txid, items in pending.items():
+            self._store.update([j['job_id'] for j in items], scanned=end)
@@ -0,0 +1,41 @@
+# -*- coding:utf-8 -*-
+
+import sys
+import asyncio
+import logging
+import argparse
+from app import logger
+from app.backfill import Backfill
+from app.sysconfig import SysConfig
+
+def main():
+    # 解析参数
+    parser = argparse.ArgumentParser(description='Backfill account history')
+    parser.add_argument('--account', help='account name, defaults to the first monitored account')
+    parser.add_argument('--end', type=int, default=None, help='last op number to backfill')
+    parser.add_argument('--connections', type=int, default=4, help='number of node connections')
+    parser.add_argument('--window', type=int, default=1000, help='operations per window')
+    parser.add_argument('--concurrency', type=int, default=8, help='windows fetched concurrently')
+    args = parser.parse_args()
+
+    # 查找账户配置
+    sysconfig = SysConfig()
+    accounts = sysconfig.accounts
+    if args.account is not None:
+        accounts = [a for a in accounts if a['name'] == args.account]
+    if len(accounts) == 0:
+        logging.critical('Account %s is not configured', args.account)
+        sys.exit(1)
+
+    # 执行回填
+    loop = asyncio.get_event_loop()
+    backfill = Backfill(sysconfig.accesses, accounts[0],
+        args.connections, args.window, args.concurrency, loop)
+    try:
+        loop.run_until_complete(backfill.run(args.end))
+        logging.info('Backfill finished.')
+    except KeyboardInterrupt:
+        logging.info('Backfill interrupted.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import yaml
+import socket
+import shutil
+import aiohttp
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.sink import WebhookSink
+from bench.fakenode import FakeNode
+from bench.wsnode import FakeNodeServer
+from bitsharesbase.account import PrivateKey
+
+EXCHANGE = 'bench-exchange'
+ASSET = 'TEST'
+
+def free_port(host='127.0.0.1'):
+    ''' 获取空闲端口
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def percentile(values, p):
+    ''' 计算百分位数
+    '''
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+def write_config(workdir, args, access, webhook, wifkey, rpc_port):
+    ''' 生成服务配置
+    '''
+    config = {
+        'access': access,
+        'account': EXCHANGE,
+        'active_key': wifkey,
+        'memo_key': wifkey,
+        'rpc_host': '127.0.0.1',
+        'rpc_port': rpc_port,
+        'workernum': args.workernum,
+        'webhook': webhook,
+        'monitor_mode': 'subscribe',
+        'crypto_executor': args.crypto_executor,
+        'batch_size': args.batch_size,
+        'pool_size': args.pool_size,
+        'rpc_workers': args.rpc_workers,
+        'confirm_irreversible': args.confirm,
+        'withdraw_watch_interval': 1,
+        'chain_params_interval': 1,
+    }
+    with open(os.path.join(workdir, 'server.yml'), 'w') as f:
+        yaml.dump(config, f)
+
+class JsonRpcClient(object):
+    ''' JSON-RPC客户端
+    '''
+
+    def __init__(self, url):
+        self.url = url
+        self._request_id = 0
+        self._session = aiohttp.ClientSession()
+
+    async def call(self, method, *params):
+        self._request_id += 1
+        request = {'jsonrpc': '2.0', 'id': self._request_id, 'method': method, 'params': list(params)}
+        async with self._session.post(self.url, json=request) as resp:
+            response = json.loads(await resp.text())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    async def close(self):
+        await self._session.close()
+
+async def wait_ready(client, proc, timeout):
+    ''' 等待服务就绪
+    '''
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.returncode is not None:
+            return False
+        try:
+            await client.call('account')
+            return True
+        except Exception:
+            await asyncio.sleep(0.2)
+    return False
+
+async def measure(concurrency, count, func):
+    ''' 并发执行并统计吞吐量和延迟
+    '''
+    latencies = []
+    errors = [0]
+    index = [0]
+
+    async def worker():
+        while index[0] < count:
+            i = index[0]
+            index[0] += 1
+            start = time.monotonic()
+            try:
+                await func(i)
+            except Exception:
+                errors[0] += 1
+            latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.monotonic() - start
+    return {
+        'count': count,
+        'errors': errors[0],
+        'rate': count / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+    }
+
+def print_rate(name, stats):
+    print('{0:<14} {1:>8.1f} req/s  p50 {2:>7.1f}ms  p99 {3:>7.1f}ms  errors {4}'.format(
+        name, stats['rate'], stats['p50'] * 1000, stats['p99'] * 1000, stats['errors']))
+
+async def run(args, workdir):
+    # 生成账户和模拟节点
+    exchange = {'name': EXCHANGE, 'wifkey': str(PrivateKey())}
+    users = [{'name': 'bench-user-{0}'.format(i), 'wifkey': str(PrivateKey())}
+        for i in range(args.users)]
+    node = FakeNode([exchange] + users, [{'symbol': ASSET, 'precision': 5}],
+        args.latency, block_interval=args.block_interval, irreversible_lag=args.irreversible_lag)
+    node_task = asyncio.ensure_future(node.run())
+    server = FakeNodeServer(node)
+    node_port = await server.start()
+    sink = WebhookSink()
+    webhook = await sink.start()
+
+    # 启动服务
+    rpc_port = free_port()
+    write_config(workdir, args, 'ws://127.0.0.1:{0}'.format(node_port), webhook,
+        exchange['wifkey'], rpc_port)
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    proc = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, 'main.py'),
+        cwd=workdir, stdout=log, stderr=log)
+    client = JsonRpcClient('http://127.0.0.1:{0}/'.format(rpc_port))
+    try:
+        if not await wait_ready(client, proc, args.timeout):
+            print('Service failed to start, see {0}'.format(log.name))
+            return False
+
+        # 充值: 预先生成交易, 按速率进入区块
+        print('Preparing {0} deposits...'.format(args.deposits))
+        txs = [node.make_transfer(users[i % len(users)]['name'], EXCHANGE, ASSET,
+            1 + i % 100, 'deposit-{0}'.format(i)) for i in range(args.deposits)]
+        deposit_ids = set()
+        start = time.time()
+        for i, tx in enumerate(txs):
+            deposit_ids.add(node.push_transaction(tx))
+            await asyncio.sleep(max(0.0, start + (i + 1) / args.rate - time.time()))
+
+        def deposits_received():
+            return len([1 for _, trx in sink.received.values() if trx['txid'] in deposit_ids])
+        ok = await sink.wait_for(lambda: deposits_received() >= args.deposits, args.timeout)
+        latencies = []
+        first, last = None, None
+        for op_id, (received, trx) in sink.received.items():
+            if trx['txid'] not in deposit_ids:
+                continue
+            produced = node.op_times[op_id]
+            latencies.append(received - produced)
+            first = produced if first is None else min(first, produced)
+            last = received if last is None else max(last, received)
+        elapsed = (last - first) if latencies else 0.0
+        print('deposits       {0}/{1} received{2}'.format(len(latencies), args.deposits,
+            '' if ok else ' (timed out)'))
+        print('deposits/s     {0:>8.1f}'.format(len(latencies) / elapsed if elapsed else 0.0))
+        print('detection      p50 {0:>7.1f}ms  p99 {1:>7.1f}ms'.format(
+            percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+
+        # 不可逆确认
+        if args.confirm:
+            def deposits_confirmed():
+                return len([1 for _, trx in sink.confirmed.values() if trx['txid'] in deposit_ids])
+            confirmed = await sink.wait_for(lambda: deposits_confirmed() >= args.deposits, args.timeout)
+            latencies = [received - node.op_times[op_id]
+                for op_id, (received, trx) in sink.confirmed.items()
+                if trx['txid'] in deposit_ids and trx['status'] == 'confirmed']
+            print('confirmed      {0}/{1}{2}'.format(len(latencies), args.deposits,
+                '' if confirmed else ' (timed out)'))
+            print('confirmation   p50 {0:>7.1f}ms  p99 {1:>7.1f}ms'.format(
+                percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+            ok = ok and confirmed
+
+        # JSON-RPC
+        print_rate('get_balances', await measure(args.concurrency, args.balances,
+            lambda i: client.call('get_balances')))
+        print_rate('transfer', await measure(args.concurrency, args.transfers,
+            lambda i: client.call('transfer', users[i % len(users)]['name'], ASSET, '1',
+                'withdraw-{0}'.format(i), 'bench-{0}'.format(i))))
+
+        # 等待提现确认
+        start = time.monotonic()
+        confirmed = 0
+        while time.monotonic() - start < args.timeout:
+            jobs = (await client.call('withdrawal_statistics'))['jobs']
+            confirmed = jobs.get('confirmed', 0)
+            if confirmed + jobs.get('failed', 0) >= args.transfers:
+                break
+            await asyncio.sleep(0.5)
+        elapsed = time.monotonic() - start
+        print('withdrawals    {0}/{1} confirmed in {2:.1f}s'.format(confirmed, args.transfers, elapsed))
+        print('node calls     {0}'.format(node.calls))
+        return ok
+    finally:
+        await client.close()
+        if proc.returncode is None:
+            proc.terminate()
+            await proc.wait()
+        log.close()
+        node_task.cancel()
+        await server.stop()
+        await sink.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark against a local fake node')
+    parser.add_argument('--deposits', type=int, default=1000, help='number of deposits')
+    parser.add_argument('--rate', type=float, default=200, help='deposits per second entering blocks')
+    parser.add_argument('--users', type=int, default=50, help='number of depositor accounts')
+    parser.add_argument('--latency', type=float, default=0.002, help='max simulated node latency (seconds)')
+    parser.add_argument('--block-interval', type=float, default=1.0, help='block interval (seconds)')
+    parser.add_argument('--irreversible-lag', type=int, default=2, help='irreversible block lag')
+    parser.add_argument('--balances', type=int, default=500, help='number of get_balances calls')
+    parser.add_argument('--transfers', type=int, default=200, help='number of transfer calls')
+    parser.add_argument('--concurrency', type=int, default=20, help='concurrent JSON-RPC callers')
+    parser.add_argument('--workernum', type=int, default=10, help='pusher workers')
+    parser.add_argument('--batch-size', type=int, default=1, help='pusher batch size')
+    parser.add_argument('--pool-size', type=int, default=4, help='RPC pool size')
+    parser.add_argument('--rpc-workers', type=int, default=0, help='RPC worker processes (0 for single process)')
+    parser.add_argument('--crypto-executor', default='process', help='process, thread or inline')
+    parser.add_argument('--confirm', action='store_true', help='wait for irreversible confirmation events')
+    parser.add_argument('--timeout', type=float, default=120, help='timeout of each phase (seconds)')
+    parser.add_argument('--keep', action='store_true', help='keep the working directory')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='btsmonitor-bench-')
+    loop = asyncio.get_event_loop()
+    try:
+        ok = loop.run_until_complete(run(args, workdir))
+    finally:
+        if args.keep:
+            print('Working directory: {0}'.format(workdir))
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
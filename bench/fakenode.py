@@ -0,0 +1,311 @@
+# -*- coding:utf-8 -*-
+
+import time
+import random
+import asyncio
+from binascii import hexlify
+from bitsharesbase import memo as BtsMemo
+from bitsharesbase.chains import known_chains
+from bitsharesbase.account import PrivateKey, PublicKey
+from bitsharesbase.signedtransactions import Signed_Transaction
+
+class FakeNode(object):
+    ''' 模拟节点
+        提供与AsyncRPC相同的调用接口, 用于压力测试和基准测试
+        :param accounts 账户列表, 每项为 {'name', 'wifkey'}
+        :param assets 资产列表, 每项为 {'symbol', 'precision'}
+        :param latency 模拟请求延迟上限(秒)
+        :param block_interval 出块间隔(秒), 广播的交易进入下一个区块
+        :param irreversible_lag 不可逆区块落后区块数量
+    '''
+
+    # 初始余额
+    INITIAL_BALANCE = 10 ** 15
+
+    def __init__(self, accounts, assets, latency=0.005, chain='BTS',
+            block_interval=0.5, irreversible_lag=2):
+        self.chain_params = known_chains[chain]
+        self.latency = latency
+        self.block_interval = block_interval
+        self.irreversible_lag = irreversible_lag
+        self.head_block_number = 1000
+        self.head_block_id = self._make_block_id(self.head_block_number)
+        self.blocks = {}
+        self.broadcasts = []
+        self.listeners = []
+        self.op_times = {}
+        self._txids = {}
+        self._pending = []
+        self._op_count = 0
+        self._next_block_time = time.time() + block_interval
+        self.calls = {}
+        self.objects = {}
+        self.names = {}
+        self.symbols = {}
+        self.pubkeys = {}
+        self.wifkeys = {}
+        self.history = {}
+        self.balances = {}
+        prefix = self.chain_params['prefix']
+        for i, item in enumerate(accounts):
+            pubkey = str(PrivateKey(item['wifkey'], prefix=prefix).pubkey)
+            authority = {'weight_threshold': 1, 'key_auths': [[pubkey, 1]],
+                'account_auths': [], 'address_auths': []}
+            account = {
+                'id': '1.2.{0}'.format(100 + i),
+                'name': item['name'],
+                'owner': authority,
+                'active': authority,
+                'options': {'memo_key': pubkey},
+                'statistics': '2.6.{0}'.format(100 + i),
+            }
+            self.objects[account['id']] = account
+            self.objects[account['statistics']] = {
+                'id': account['statistics'],
+                'owner': account['id'],
+                'total_ops': 0,
+                'removed_ops': 0,
+            }
+            self.names[account['name']] = account
+            self.pubkeys[account['id']] = pubkey
+            self.wifkeys[account['id']] = item['wifkey']
+            self.history[account['id']] = []
+            self.balances[account['id']] = {}
+        for i, item in enumerate(assets):
+            asset = {
+                'id': '1.3.{0}'.format(i + 1),
+                'symbol': item['symbol'],
+                'precision': item['precision'],
+                'options': {'core_exchange_rate': {
+                    'base': {'amount': 1, 'asset_id': '1.3.{0}'.format(i + 1)},
+                    'quote': {'amount': 10, 'asset_id': '1.3.0'},
+                }},
+            }
+            self.objects[asset['id']] = asset
+            self.symbols[asset['symbol']] = asset
+            for balances in self.balances.values():
+                balances[asset['id']] = self.INITIAL_BALANCE
+        self.objects['2.0.0'] = {
+            'id': '2.0.0',
+            'parameters': {
+                'maximum_transaction_size': 2048,
+                'current_fees': {
+                    'parameters': [[0, {'fee': 2000000, 'price_per_kbyte': 1000000}]],
+                    'scale': 10000,
+                },
+            },
+        }
+
+    async def _delay(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        await asyncio.sleep(random.uniform(0, self.latency))
+
+    def _make_block_id(self, block_num):
+        return '{0:08x}'.format(block_num) + hexlify(
+            random.getrandbits(128).to_bytes(16, 'big')).decode('ascii')
+
+    def _format_time(self, timestamp):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp))
+
+    def _produce_blocks(self):
+        ''' 按出块间隔生成区块, 待确认交易进入下一个区块
+        '''
+        now = time.time()
+        changed = {}
+        while self._next_block_time <= now:
+            self.head_block_number += 1
+            self.head_block_id = self._make_block_id(self.head_block_number)
+            self.blocks[self.head_block_number] = {
+                'block_id': self.head_block_id,
+                'timestamp': self._format_time(self._next_block_time),
+                'transactions': [item['tx'] for item in self._pending],
+            }
+            for trx_in_block, item in enumerate(self._pending):
+                self._txids[item['id']] = (self.head_block_number, trx_in_block)
+                for obj in self._apply(self.head_block_number, trx_in_block, item['tx'], now):
+                    changed[obj['id']] = obj
+            self._pending = []
+            self._next_block_time += self.block_interval
+            changed['2.1.0'] = self._dynamic_properties()
+        if len(changed) > 0:
+            for listener in self.listeners:
+                listener(list(changed.values()))
+
+    def _apply(self, block_num, trx_in_block, tx, now):
+        ''' 执行交易中的转账操作, 写入账户历史, 返回变更的账户统计对象
+        '''
+        changed = []
+        for op_in_trx, op in enumerate(tx['operations']):
+            if op[0] != 0:
+                continue
+            data = op[1]
+            self._op_count += 1
+            operation = {
+                'id': '1.11.{0}'.format(self._op_count),
+                'op': op,
+                'result': [0, {}],
+                'block_num': block_num,
+                'trx_in_block': trx_in_block,
+                'op_in_trx': op_in_trx,
+                'virtual_op': self._op_count,
+            }
+            self.op_times[operation['id']] = now
+            amount, fee = data['amount'], data['fee']
+            sender = self.balances[data['from']]
+            sender[amount['asset_id']] -= int(amount['amount'])
+            sender[fee['asset_id']] = sender.get(fee['asset_id'], 0) - int(fee['amount'])
+            receiver = self.balances[data['to']]
+            receiver[amount['asset_id']] = receiver.get(amount['asset_id'], 0) + int(amount['amount'])
+            for account_id in set([data['from'], data['to']]):
+                self.history[account_id].append(operation)
+                statistics = self.objects[self.objects[account_id]['statistics']]
+                statistics['total_ops'] += 1
+                changed.append(statistics)
+        return changed
+
+    def make_transfer(self, sender, to, symbol, amount, memo=None):
+        ''' 生成转账交易(不签名), 备注使用发送方私钥加密
+            :param sender 发送方账户名
+            :param to 接收方账户名
+        '''
+        prefix = self.chain_params['prefix']
+        sender = self.names[sender]
+        to = self.names[to]
+        asset = self.symbols[symbol]
+        data = {
+            'fee': {'amount': 100, 'asset_id': asset['id']},
+            'from': sender['id'],
+            'to': to['id'],
+            'amount': {'amount': int(amount * 10 ** asset['precision']), 'asset_id': asset['id']},
+            'extensions': [],
+        }
+        if memo is not None:
+            nonce = str(random.getrandbits(64))
+            data['memo'] = {
+                'from': sender['options']['memo_key'],
+                'to': to['options']['memo_key'],
+                'nonce': nonce,
+                'message': BtsMemo.encode_memo(
+                    PrivateKey(self.wifkeys[sender['id']], prefix=prefix),
+                    PublicKey(to['options']['memo_key'], prefix=prefix), nonce, memo),
+            }
+        return {
+            'ref_block_num': self.head_block_number & 0xFFFF,
+            'ref_block_prefix': random.getrandbits(32),
+            'expiration': self._format_time(time.time() + 3600),
+            'operations': [[0, data]],
+            'extensions': [],
+            'signatures': [],
+        }
+
+    def push_transaction(self, tx):
+        ''' 直接加入待出块交易(不校验签名), 返回交易ID
+        '''
+        txid = Signed_Transaction(**tx).id
+        self._txids[txid] = None
+        self._pending.append({'tx': tx, 'id': txid})
+        return txid
+
+    async def run(self):
+        ''' 定时出块
+        '''
+        while True:
+            self._produce_blocks()
+            await asyncio.sleep(max(0.0, self._next_block_time - time.time()))
+
+    async def get_dynamic_global_properties(self, **kwargs):
+        await self._delay('get_dynamic_global_properties')
+        self._produce_blocks()
+        return self._dynamic_properties()
+
+    def _dynamic_properties(self):
+        return {
+            'id': '2.1.0',
+            'head_block_number': self.head_block_number,
+            'head_block_id': self.head_block_id,
+            'last_irreversible_block_num': self.head_block_number - self.irreversible_lag,
+            'time': self._format_time(time.time()),
+            'next_maintenance_time': '2018-01-01T01:00:00',
+        }
+
+    async def get_block(self, block_num, **kwargs):
+        await self._delay('get_block')
+        self._produce_blocks()
+        return self.blocks.get(block_num)
+
+    async def get_recent_transaction_by_id(self, txid, **kwargs):
+        await self._delay('get_recent_transaction_by_id')
+        self._produce_blocks()
+        position = self._txids.get(txid)
+        if position is None:
+            return None
+        return self.blocks[position[0]]['transactions'][position[1]]
+
+    async def get_block_header(self, block_num, **kwargs):
+        await self._delay('get_block_header')
+        self._produce_blocks()
+        block = self.blocks.get(block_num)
+        if block is None:
+            return None
+        return {'timestamp': block['timestamp'], 'previous': '', 'witness': '1.6.1'}
+
+    async def get_transaction(self, block_num, trx_in_block, **kwargs):
+        await self._delay('get_transaction')
+        return self.blocks[block_num]['transactions'][trx_in_block]
+
+    async def get_relative_account_history(self, account_id, stop, limit, start, **kwargs):
+        await self._delay('get_relative_account_history')
+        history = self.history[account_id]
+        if start == 0 or start > len(history):
+            start = len(history)
+        return [history[seq - 1] for seq in range(start, max(stop, 1) - 1, -1)][:limit]
+
+    async def get_named_account_balances(self, name, assets, **kwargs):
+        await self._delay('get_named_account_balances')
+        balances = self.balances[self.names[name]['id']]
+        return [{'amount': amount, 'asset_id': asset_id} for asset_id, amount in sorted(balances.items())]
+
+    async def get_objects(self, ids, **kwargs):
+        await self._delay('get_objects')
+        self._produce_blocks()
+        return [self._dynamic_properties() if i == '2.1.0' else self.objects.get(i) for i in ids]
+
+    async def get_account_by_name(self, name, **kwargs):
+        await self._delay('get_account_by_name')
+        return self.names.get(name)
+
+    async def lookup_asset_symbols(self, symbols_or_ids, **kwargs):
+        await self._delay('lookup_asset_symbols')
+        return [self.symbols.get(s) or self.objects.get(s) for s in symbols_or_ids]
+
+    async def get_required_fees(self, ops, asset_id, **kwargs):
+        await self._delay('get_required_fees')
+        return [{'amount': 100, 'asset_id': asset_id} for _ in ops]
+
+    async def broadcast_transaction(self, tx, **kwargs):
+        await self._delay('broadcast_transaction')
+        self._produce_blocks()
+        signedtx = Signed_Transaction(**tx)
+        if signedtx.id in self._txids:
+            raise Exception('duplicate transaction {0}'.format(signedtx.id))
+        self._txids[signedtx.id] = None
+        item = {'tx': tx, 'id': signedtx.id}
+        self.broadcasts.append(item)
+        self._pending.append(item)
+        return None
+
+    def verify(self, account_id):
+        ''' 校验已广播交易的签名, 返回只含一个有效签名的交易数量
+        '''
+        valid = 0
+        pubkey = PublicKey(self.pubkeys[account_id], prefix=self.chain_params['prefix'])
+        for item in self.broadcasts:
+            if len(item['tx']['signatures']) != 1:
+                continue
+            signedtx = Signed_Transaction(**item['tx'])
+            try:
+                signedtx.verify([pubkey], self.chain_params)
+                valid += 1
+            except Exception:
+                pass
+        return valid
@@ -0,0 +1,64 @@
+# -*- coding:utf-8 -*-
+
+import time
+import socket
+import asyncio
+from aiohttp import web
+
+class WebhookSink(object):
+    ''' 本地回调接收端, 记录每个通知的到达时间
+        received为首次通知(无状态或pending), confirmed为不可逆确认事件
+    '''
+
+    def __init__(self):
+        self.received = {}
+        self.confirmed = {}
+        self.requests = 0
+        self._runner = None
+        self._changed = asyncio.Event()
+
+    async def start(self, host='127.0.0.1'):
+        ''' 启动服务, 返回回调地址
+        '''
+        app = web.Application()
+        app.router.add_post('/', self._handle)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, 0))
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.SockSite(self._runner, sock).start()
+        return 'http://{0}:{1}/'.format(host, sock.getsockname()[1])
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def wait_for(self, predicate, timeout):
+        ''' 等待满足条件, 超时返回False
+        '''
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _handle(self, request):
+        ''' 接收通知(单个或批量数组)
+        '''
+        now = time.time()
+        body = await request.json()
+        self.requests += 1
+        for trx in body if isinstance(body, list) else [body]:
+            if trx.get('status') in (None, 'pending'):
+                self.received.setdefault(trx['op_id'], (now, trx))
+            else:
+                self.confirmed.setdefault(trx['op_id'], (now, trx))
+        self._changed.set()
+        return web.Response()
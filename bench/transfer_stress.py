@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sys
+import time
+import yaml
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import sysconfig
+from bitsharesbase.account import PrivateKey
+from bench.fakenode import FakeNode
+
+def make_config(account, wifkey):
+    ''' 生成压测配置文件
+    '''
+    config = {
+        'access': 'localhost',
+        'account': account,
+        'active_key': wifkey,
+        'memo_key': wifkey,
+        'rpc_host': '127.0.0.1',
+        'rpc_port': 0,
+        'workernum': 1,
+        'webhook': 'http://127.0.0.1/',
+        'crypto_executor': 'inline',
+    }
+    fd, path = tempfile.mkstemp(suffix='.yml')
+    with os.fdopen(fd, 'w') as f:
+        yaml.dump(config, f)
+    return path
+
+async def run(args):
+    from app.cache import ChainCache
+    from app.transfer import Transfer
+
+    # 生成账户
+    sender = {'name': 'bench-sender', 'wifkey': str(PrivateKey())}
+    recipients = [{'name': 'bench-user-{0}'.format(i), 'wifkey': str(PrivateKey())}
+        for i in range(args.recipients)]
+    sysconfig.CONFIG_FILE_PATH = make_config(sender['name'], sender['wifkey'])
+    node = FakeNode([sender] + recipients, [{'symbol': 'TEST', 'precision': 5}], args.latency)
+
+    # 并发转账
+    account = await ChainCache().get_account_by_name(node, sender['name'])
+    asset = await ChainCache().lookup_asset(node, 'TEST')
+    transfers = [{
+        'to': recipients[i % len(recipients)]['name'],
+        'asset': asset,
+        'amount': i + 1,
+        'memo': 'withdraw-{0}'.format(i),
+    } for i in range(args.count)]
+
+    start = time.monotonic()
+    if args.batch:
+        results = await Transfer(node, account).batch_send(transfers)
+    else:
+        results = await asyncio.gather(*[Transfer(node, account).send_to(
+            t['to'], t['asset'], t['amount'], t['memo']) for t in transfers],
+            return_exceptions=True)
+    elapsed = time.monotonic() - start
+    os.remove(sysconfig.CONFIG_FILE_PATH)
+
+    # 校验交易, 每个转账只能出现一次且金额与接收人一致
+    expected = sorted([(node.names[t['to']]['id'], (t['amount']) * 10 ** 5) for t in transfers])
+    actual = []
+    for item in node.broadcasts:
+        for op in item['tx']['operations']:
+            actual.append((op[1]['to'], op[1]['amount']['amount']))
+    errors = [r for r in results if isinstance(r, Exception) or (isinstance(r, dict) and 'error' in r)]
+    valid = node.verify(account['id'])
+
+    print('transfers:     {0}'.format(args.count))
+    print('transactions:  {0} ({1} with a single valid signature)'.format(len(node.broadcasts), valid))
+    print('errors:        {0}'.format(len(errors)))
+    print('elapsed:       {0:.3f}s ({1:.1f} transfers/s)'.format(elapsed, args.count / elapsed))
+    print('node calls:    {0}'.format(node.calls))
+    ok = (len(errors) == 0 and valid == len(node.broadcasts) and
+        sorted(actual) == sorted([(to, int(amount)) for to, amount in expected]))
+    print('result:        {0}'.format('OK' if ok else 'MISMATCH'))
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent transfer stress test against a fake node')
+    parser.add_argument('-n', '--count', type=int, default=200, help='number of transfers')
+    parser.add_argument('--recipients', type=int, default=20, help='number of recipient accounts')
+    parser.add_argument('--latency', type=float, default=0.005, help='max simulated node latency (seconds)')
+    parser.add_argument('--batch', action='store_true', help='use Transfer.batch_send instead of concurrent send_to')
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    ok = loop.run_until_complete(run(args))
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding:utf-8 -*-
+
+import json
+import asyncio
+import logging
+import websockets
+
+class FakeNodeServer(object):
+    ''' 模拟节点websocket服务
+        实现AsyncRPC使用的Graphene接口(login, API注册, 订阅通知), 其余调用转发给FakeNode
+        :param node 模拟节点
+    '''
+    API_IDS = {'database': 2, 'history': 3, 'network_broadcast': 4}
+
+    def __init__(self, node):
+        self.node = node
+        self.connections = 0
+        self._subscribers = {}
+        self._server = None
+        node.listeners.append(self._on_change)
+
+    async def start(self, host='127.0.0.1', port=0):
+        ''' 启动服务, 返回监听端口
+        '''
+        self._server = await websockets.serve(self._handle, host, port, max_size=2**20*8)
+        return self._server.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _on_change(self, objects):
+        ''' 对象变更时推送订阅通知
+        '''
+        for websocket, callback_id in list(self._subscribers.items()):
+            payload = json.dumps({'method': 'notice', 'params': [callback_id, [objects]]})
+            asyncio.ensure_future(self._send(websocket, payload))
+
+    async def _send(self, websocket, payload):
+        try:
+            await websocket.send(payload)
+        except websockets.ConnectionClosed:
+            self._subscribers.pop(websocket, None)
+
+    async def _handle(self, websocket, path=None):
+        ''' 处理连接, 每个请求并发执行
+        '''
+        self.connections += 1
+        try:
+            while True:
+                payload = await websocket.recv()
+                asyncio.ensure_future(self._call(websocket, json.loads(payload)))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self._subscribers.pop(websocket, None)
+
+    async def _call(self, websocket, request):
+        ''' 执行请求
+        '''
+        _, name, args = request['params']
+        response = {'id': request['id'], 'jsonrpc': '2.0'}
+        try:
+            if name == 'login':
+                result = True
+            elif name in self.API_IDS:
+                result = self.API_IDS[name]
+            elif name == 'get_chain_properties':
+                result = {'id': '2.11.0', 'chain_id': self.node.chain_params['chain_id']}
+            elif name == 'set_subscribe_callback':
+                self._subscribers[websocket] = args[0]
+                result = None
+            else:
+                result = await getattr(self.node, name)(*args)
+            response['result'] = result
+        except Exception as e:
+            logging.debug('Fake node call %s failed, %s', name, str(e))
+            response['error'] = {'code': 1, 'message': str(e)}
+        await self._send(websocket, json.dumps(response))
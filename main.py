@@ -1,29 +1,125 @@
 # -*- coding:utf-8 -*-
 
+import os
 import sys
+import time
 import signal
 import asyncio
 import logging
+import multiprocessing
 from app import logger
 from app.monitor import Monitor
-from app.rpcserver import RpcServer
+from app.rpcpool import RpcPool
+from app.rpcserver import RpcServer, listen_metrics
+from app.withdrawal import WithdrawalEngine
 from app.sysconfig import SysConfig
+from app.chainparams import ChainParams
+from app.cryptopool import CryptoExecutor
+
+# 子进程退出等待时间(秒)
+SHUTDOWN_TIMEOUT = 30
 
 def handler(signum, frame):
     asyncio.get_event_loop().stop()
     logging.info('Bitshares monitor server stopped.')
 
+def run_forever():
+    ''' 子进程进入事件循环, 退出时关闭加密计算执行器
+    '''
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+    try:
+        asyncio.get_event_loop().run_forever()
+    except Exception as e:
+        logging.critical('Event loop error, %s', str(e))
+    CryptoExecutor().shutdown()
+
+def run_core():
+    ''' 核心进程: 运行监控和提现签名, 不提供RPC服务
+    '''
+    sysconfig = SysConfig()
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    Monitor(sysconfig.accesses, sysconfig.accounts)
+    pool = RpcPool(sysconfig.accesses, sysconfig.pool_size)
+    ChainParams().start(pool)
+    WithdrawalEngine(pool)
+    listen_metrics(sysconfig.rpc_host, sysconfig.metrics_port)
+    logging.info('Bitshares monitor core process start.')
+    run_forever()
+
+def run_worker(index):
+    ''' RPC工作进程: 共享监听端口, 提现任务只写入任务库, 不签名
+        :param index 进程序号
+    '''
+    sysconfig = SysConfig()
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    pool = RpcPool(sysconfig.accesses, sysconfig.pool_size)
+    withdrawals = WithdrawalEngine(pool, signer=False)
+    server = RpcServer(pool, None, withdrawals)
+    server.listen(sysconfig.rpc_host, sysconfig.rpc_port, reuse_port=True)
+    logging.info('Bitshares monitor RPC worker %d start.', index)
+    run_forever()
+
+def supervise(workers):
+    ''' 启动并守护核心进程和RPC工作进程, 子进程异常退出后重新启动
+        :param workers RPC工作进程数量
+    '''
+    targets = {'core': (run_core, ())}
+    for index in range(workers):
+        targets['worker-{0}'.format(index)] = (run_worker, (index,))
+
+    processes = {}
+    def start(name):
+        target, args = targets[name]
+        process = multiprocessing.Process(target=target, args=args, name=name)
+        process.start()
+        processes[name] = process
+
+    stopped = []
+    def stop(signum, frame):
+        stopped.append(signum)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    logging.info('Bitshares monitor server start, %d RPC workers.', workers)
+    for name in sorted(targets):
+        start(name)
+    while len(stopped) == 0:
+        time.sleep(1)
+        for name, process in list(processes.items()):
+            if not process.is_alive() and len(stopped) == 0:
+                logging.warn('Process %s exited with code %s, restarting', name, process.exitcode)
+                start(name)
+
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate()
+    for process in processes.values():
+        process.join(SHUTDOWN_TIMEOUT)
+        if process.is_alive():
+            logging.warn('Process %s did not exit in %ds, killing', process.name, SHUTDOWN_TIMEOUT)
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+    logging.info('Bitshares monitor server stopped.')
+
 def main():
     # 初始配置
     sysconfig = SysConfig()
 
+    # 多进程模式
+    if sysconfig.rpc_workers > 0:
+        supervise(sysconfig.rpc_workers)
+        return
+
     # 运行监控
-    Monitor(sysconfig.access, sysconfig.account)
+    monitor = Monitor(sysconfig.accesses, sysconfig.accounts)
     signal.signal(signal.SIGINT, handler)
     signal.signal(signal.SIGTERM, handler)
 
     # 启动RPC服务
-    server = RpcServer()
+    pool = RpcPool(sysconfig.accesses, sysconfig.pool_size)
+    withdrawals = WithdrawalEngine(pool)
+    server = RpcServer(pool, monitor, withdrawals)
     server.listen(sysconfig.rpc_host, sysconfig.rpc_port)
 
     # 进入事件循环